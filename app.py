@@ -1,7 +1,10 @@
 """ The core functionality of the app is here
     written by Danial Senejohnny """
 # from app.epitope import Epitope
+import os
 import warnings
+from urllib.parse import urlencode
+import flask
 import dash
 from dash import no_update
 from dash.dependencies import Input, Output, State
@@ -13,10 +16,15 @@ from pygit2 import Repository
 
 from app.visualisation import VisualiseHLA, vis_cards
 from app.desa import DESA
-from app.dash_utils import filtering_logic, Header, dashtable_data_compatibility
+from app.dash_utils import Header, paginated_table
+from app.tx_table import FILTER_FIELDS, PAGE_SIZE, filtered_ids, normalise_filters, store_ids, page_frame
+from app.tx_export import iter_csv, iter_parquet
 
 warnings.filterwarnings("ignore")
 
+# Set DESA_BACKEND=sqlite to filter the transplant table with the SQLite backend
+DESA_BACKEND = os.environ.get('DESA_BACKEND', 'pandas')
+
 # mongo_client = MongoClient('localhost', 27017) # build a new client instance of MongoClient
 # db = mongo_client.desa_database # create new database
 # desa_col = db['desa_db'] # create new collection instance
@@ -100,6 +108,10 @@ app.layout = dbc.Container([
 # App Layout Pieces
 # ######################################################################
 show_button =  dbc.Button('Show Table', id='show-table', n_clicks=0)
+export_links = [
+    html.A('Download CSV', id='export-csv', href='/export/transplants.csv', download='transplants.csv', style={'padding':5}),
+    html.A('Download Parquet', id='export-parquet', href='/export/transplants.parquet', download='transplants.parquet', style={'padding':5}),
+]
 sortby_dropdown = [
     html.H6('Sort By'),
     dcc.Dropdown(
@@ -167,7 +179,8 @@ filter_card = dbc.Card(
             [
                 dbc.Row(
                     [
-                        dbc.Col(show_button, style={'padding':5}, align="center")
+                        dbc.Col(show_button, style={'padding':5}, align="center"),
+                        dbc.Col(export_links, style={'padding':5}, align="center"),
                     ],
                 ),
                 dbc.Row(
@@ -316,17 +329,68 @@ def render_content(tab):
 def table(n_clicks, sort_by, hla_class, hla, donor_type):
     if n_clicks == 0:
         return html.P('Click on "Show Table" button to see the table'), None
-    desa = DESA()
-    desa_df = filtering_logic(desa, sort_by, hla_class, hla, donor_type, None)
-    desa_df = dashtable_data_compatibility(desa_df)
-    return dbc.Table.from_dataframe(
-        desa_df,
-        bordered=True,
-        dark=True,
-        hover=True,
-        striped=True,
-        size='sm',
-        ), f'Records: {len(desa_df)}'
+    filters = normalise_filters(sort_by, hla_class, hla, donor_type)
+    ids = filtered_ids(**dict(zip(FILTER_FIELDS, filters)), backend=DESA_BACKEND)
+    token = store_ids(ids)
+    records = DESA().get_txs(ids[:PAGE_SIZE], display=True).to_dict('records')
+    return paginated_table(token, filters, records, len(ids)), f'Records: {len(ids)}'
+
+@app.callback(Output('tx-datatable', 'data'),
+              [Input('tx-datatable', 'page_current'),
+               Input('tx-datatable', 'page_size'),
+               Input('tx-datatable', 'sort_by')],
+              [State('tx-table-token', 'data')])
+def update_table_page(page_current, page_size, sort_by, table_state):
+    """ Serialises only the visible page of the cached table, a worker that did not
+    serve "Show Table" computes the table again from the stored filters """
+    if not table_state:
+        return no_update
+    page_df = page_frame(
+        table_state['token'], page_current, page_size, sort_by,
+        filters=table_state['filters'], backend=DESA_BACKEND,
+    )
+    if page_df is None:
+        return no_update
+    return page_df.to_dict('records')
+
+###############################################################
+# Export of the filtered table
+###############################################################
+EXPORT_FILTERS = ['sort_by', 'hla_class', 'hla', 'donor_type']
+
+@app.callback([Output('export-csv', 'href'),
+               Output('export-parquet', 'href')],
+              [Input('dropdown_sortby', 'value'),
+               Input('dropdown_class', 'value'),
+               Input('input_hla', 'value'),
+               Input('dropdown_donor_type', 'value'),])
+def export_links_href(sort_by, hla_class, hla, donor_type):
+    """ Keeps the filters of the table in the query string of the download links """
+    values = dict(zip(EXPORT_FILTERS, [sort_by, hla_class, hla, donor_type]))
+    query = urlencode({name: value for name, value in values.items() if value})
+    return f'/export/transplants.csv?{query}', f'/export/transplants.parquet?{query}'
+
+@app.server.route('/export/transplants.<file_format>')
+def export_transplants(file_format):
+    """ Streams the filtered table in chunks, CSV text or Parquet row groups """
+    if file_format not in ['csv', 'parquet']:
+        flask.abort(404)
+    try:
+        ids = filtered_ids(*[flask.request.args.get(name) for name in EXPORT_FILTERS], backend=DESA_BACKEND)
+    except KeyError as error:
+        flask.abort(400, str(error))
+    if file_format == 'csv':
+        chunks, mimetype = iter_csv(ids), 'text/csv'
+    else:
+        try:
+            chunks, mimetype = iter_parquet(ids), 'application/octet-stream'
+        except ImportError as error:
+            flask.abort(501, str(error))
+    return flask.Response(
+        flask.stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=transplants.{file_format}'},
+    )
 
 ###############################################################
 # Callback Visualisation from Transplants
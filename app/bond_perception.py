@@ -0,0 +1,187 @@
+"""Bond perception
+This module works out the covalent bonds of a parsed PDB structure without
+building a full topology. Bonds inside standard amino acids come from residue
+templates, all the remaining bonds (peptide links, disulfides, hydrogens,
+hetero groups) are found on a spatial hash grid over the atom coordinates."""
+
+from itertools import product
+
+import numpy as np
+
+# Heavy atom bonds shared by all amino acids
+_BACKBONE = (('N', 'CA'), ('CA', 'C'), ('C', 'O'), ('C', 'OXT'))
+
+# Side chain heavy atom bonds of the standard amino acids
+_SIDECHAINS = {
+    'ALA': (('CA', 'CB'),),
+    'ARG': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD'), ('CD', 'NE'), ('NE', 'CZ'),
+            ('CZ', 'NH1'), ('CZ', 'NH2')),
+    'ASN': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'OD1'), ('CG', 'ND2')),
+    'ASP': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'OD1'), ('CG', 'OD2')),
+    'CYS': (('CA', 'CB'), ('CB', 'SG')),
+    'GLN': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD'), ('CD', 'OE1'), ('CD', 'NE2')),
+    'GLU': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD'), ('CD', 'OE1'), ('CD', 'OE2')),
+    'GLY': (),
+    'HIS': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'ND1'), ('ND1', 'CE1'), ('CE1', 'NE2'),
+            ('NE2', 'CD2'), ('CD2', 'CG')),
+    'ILE': (('CA', 'CB'), ('CB', 'CG1'), ('CG1', 'CD1'), ('CB', 'CG2')),
+    'LEU': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD1'), ('CG', 'CD2')),
+    'LYS': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD'), ('CD', 'CE'), ('CE', 'NZ')),
+    'MET': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'SD'), ('SD', 'CE')),
+    'PHE': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD1'), ('CD1', 'CE1'), ('CE1', 'CZ'),
+            ('CZ', 'CE2'), ('CE2', 'CD2'), ('CD2', 'CG')),
+    'PRO': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD'), ('CD', 'N')),
+    'SER': (('CA', 'CB'), ('CB', 'OG')),
+    'THR': (('CA', 'CB'), ('CB', 'OG1'), ('CB', 'CG2')),
+    'TRP': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD1'), ('CD1', 'NE1'), ('NE1', 'CE2'),
+            ('CE2', 'CD2'), ('CD2', 'CG'), ('CE2', 'CZ2'), ('CZ2', 'CH2'), ('CH2', 'CZ3'),
+            ('CZ3', 'CE3'), ('CE3', 'CD2')),
+    'TYR': (('CA', 'CB'), ('CB', 'CG'), ('CG', 'CD1'), ('CD1', 'CE1'), ('CE1', 'CZ'),
+            ('CZ', 'CE2'), ('CE2', 'CD2'), ('CD2', 'CG'), ('CZ', 'OH')),
+    'VAL': (('CA', 'CB'), ('CB', 'CG1'), ('CB', 'CG2')),
+}
+
+# Protonation/force field variants of the standard residue names
+_ALIASES = {
+    'HID': 'HIS', 'HIE': 'HIS', 'HIP': 'HIS', 'HSD': 'HIS', 'HSE': 'HIS', 'HSP': 'HIS',
+    'CYX': 'CYS', 'CYM': 'CYS', 'ASH': 'ASP', 'GLH': 'GLU', 'LYN': 'LYS',
+}
+
+RESIDUE_TEMPLATES = {
+    resname: _BACKBONE + _SIDECHAINS[_ALIASES.get(resname, resname)]
+    for resname in [*_SIDECHAINS, *_ALIASES]
+}
+
+# Atom name pairs that link two template residues (peptide bond, disulfide)
+LINK_PAIRS = {('C', 'N'), ('N', 'C'), ('SG', 'SG')}
+
+# Covalent radii in Angstrom, a bond is accepted below r1 + r2 + BOND_TOLERANCE
+COVALENT_RADII = {
+    'H': 0.31, 'C': 0.76, 'N': 0.71, 'O': 0.66, 'S': 1.05, 'P': 1.07,
+    'F': 0.57, 'CL': 1.02, 'BR': 1.20, 'I': 1.39, 'SE': 1.20,
+}
+DEFAULT_RADIUS = 0.76
+BOND_TOLERANCE = 0.4
+GRID_CELL = 2 * max(COVALENT_RADII.values()) + BOND_TOLERANCE
+
+# Half shell of neighbouring cells, every unordered cell pair is visited once
+_HALF_SHELL = [offset for offset in product((-1, 0, 1), repeat=3) if offset > (0, 0, 0)]
+
+
+def _elements(atoms: np.ndarray) -> np.ndarray:
+    """ Element symbol per atom, taken from the atom name when the element is missing """
+    elements = np.char.upper(atoms['element'])
+    missing = elements == ''
+    names = np.char.lstrip(atoms['name'], '0123456789')
+    elements[missing] = np.array([name[:1] for name in names[missing].tolist()], dtype='U2')
+    return elements
+
+
+def _residue_runs(atoms: np.ndarray) -> np.ndarray:
+    """ Sequential residue number per atom, a new residue starts on every change
+    of chain, residue number or residue name """
+    change = np.zeros(len(atoms), dtype=bool)
+    for field in ('chain', 'resid', 'resname'):
+        change[1:] |= atoms[field][1:] != atoms[field][:-1]
+    return np.cumsum(change)
+
+
+def _template_bonds(atoms: np.ndarray, residues: np.ndarray):
+    """ Bonds from the residue templates and the mask of atoms the templates cover """
+    bonds = []
+    covered = np.zeros(len(atoms), dtype=bool)
+    starts = np.flatnonzero(np.r_[True, residues[1:] != residues[:-1]])
+    stops = np.r_[starts[1:], len(atoms)]
+    names = atoms['name'].tolist()
+    resnames = atoms['resname'].tolist()
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        template = RESIDUE_TEMPLATES.get(resnames[start])
+        if template is None:
+            continue
+        index = {names[i]: i for i in range(start, stop)}
+        for name1, name2 in template:
+            if name1 in index and name2 in index:
+                bonds.append((index[name1], index[name2]))
+                covered[index[name1]] = covered[index[name2]] = True
+    return np.array(bonds, dtype=np.int64).reshape(-1, 2), covered
+
+
+def neighbour_pairs(xyz: np.ndarray, cutoff: float) -> np.ndarray:
+    """
+    All the atom pairs (i < j) closer than cutoff, found on a hash grid
+    with cells of size cutoff so only neighbouring cells are compared
+    """
+    n_atoms = len(xyz)
+    if n_atoms < 2:
+        return np.empty((0, 2), dtype=np.int64)
+    cells = np.floor(xyz / cutoff).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    dims = cells.max(axis=0) + 2
+    keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    pairs = []
+    for offset in [(0, 0, 0), *_HALF_SHELL]:
+        shift = (offset[0] * dims[1] + offset[1]) * dims[2] + offset[2]
+        starts = np.searchsorted(sorted_keys, keys + shift, side='left')
+        counts = np.searchsorted(sorted_keys, keys + shift, side='right') - starts
+        first = np.repeat(np.arange(n_atoms), counts)
+        position = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        second = order[np.repeat(starts, counts) + position]
+        if offset == (0, 0, 0):
+            keep = first < second
+            first, second = first[keep], second[keep]
+        pairs.append(np.stack([first, second], axis=1))
+    pairs = np.concatenate(pairs)
+    distance2 = ((xyz[pairs[:, 0]] - xyz[pairs[:, 1]]) ** 2).sum(axis=1)
+    pairs = pairs[distance2 < cutoff ** 2]
+    return np.sort(pairs, axis=1)
+
+
+def perceive_bonds(atoms: np.ndarray) -> np.ndarray:
+    """
+    Work out the covalent bonds of a structure from its atom array
+    (see pdb_parser.ATOM_DTYPE) and return them as an (n, 2) array of
+    atom indices with i < j, sorted by the first and then the second index
+    """
+    if len(atoms) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    xyz = atoms['xyz'].astype(np.float64)
+    residues = _residue_runs(atoms)
+    bonds, covered = _template_bonds(atoms, residues)
+
+    elements = _elements(atoms)
+    radii = np.array([COVALENT_RADII.get(element, DEFAULT_RADIUS) for element in elements.tolist()])
+    hydrogen = elements == 'H'
+    names = atoms['name']
+
+    pairs = neighbour_pairs(xyz, GRID_CELL)
+    first, second = pairs[:, 0], pairs[:, 1]
+    distance = np.sqrt(((xyz[first] - xyz[second]) ** 2).sum(axis=1))
+    in_reach = distance < radii[first] + radii[second] + BOND_TOLERANCE
+
+    both_covered = covered[first] & covered[second]
+    same_residue = residues[first] == residues[second]
+    linked = np.array(
+        [pair in LINK_PAIRS for pair in zip(names[first].tolist(), names[second].tolist())],
+        dtype=bool,
+    )
+    # template residues only link through the peptide bond or a disulfide,
+    # any other atom bonds on distance alone
+    accepted = in_reach & np.where(both_covered, ~same_residue & linked, True)
+    accepted &= ~(hydrogen[first] & hydrogen[second])
+
+    # a hydrogen keeps only its closest partner
+    with_h = accepted & (hydrogen[first] | hydrogen[second])
+    if with_h.any():
+        candidates = np.flatnonzero(with_h)
+        h_atom = np.where(hydrogen[first[candidates]], first[candidates], second[candidates])
+        closest = np.lexsort((distance[candidates], h_atom))
+        keep = np.r_[True, h_atom[closest][1:] != h_atom[closest][:-1]]
+        accepted[candidates] = False
+        accepted[candidates[closest[keep]]] = True
+
+    bonds = np.concatenate([np.sort(bonds, axis=1), pairs[accepted]])
+    bonds = np.unique(bonds, axis=0)
+    return bonds
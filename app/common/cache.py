@@ -0,0 +1,88 @@
+""" Bounded in-process caches """
+import os
+import time
+import threading
+from collections import OrderedDict
+
+
+def file_version(path:str) -> tuple:
+    """ Version of a data file, it changes whenever the file is replaced or modified """
+    stat = os.stat(os.path.expanduser(path))
+    return (os.path.abspath(os.path.expanduser(path)), stat.st_size, stat.st_mtime_ns)
+
+
+def dir_version(path:str) -> tuple:
+    """ Version of a directory tree, it changes whenever a file is added to or removed
+    from the directory or one of its subdirectories """
+    path = os.path.abspath(os.path.expanduser(path))
+    version = [(path, os.stat(path).st_mtime_ns)]
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                version.append((entry.name, entry.stat().st_mtime_ns))
+    return tuple(sorted(version))
+
+
+class LRUCache:
+    """ Thread safe LRU cache with an optional time to live (seconds) per entry
+    and hit/miss counters. All entries are dropped when the data version changes """
+
+    def __init__(self, maxsize:int=128, ttl:float=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f""" LRUCache(size={len(self._entries)}, maxsize={self.maxsize}, hits={self.hits}, misses={self.misses}) """
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+    def set_version(self, version):
+        """ Drops all the entries if the version of the underlying data changed """
+        with self._lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def items(self) -> list:
+        """ Snapshot of the (key, value) pairs that have not expired, the hit/miss
+        counters and the LRU order are not changed """
+        with self._lock:
+            now = time.monotonic()
+            return [
+                (key, value) for key, (stored, value) in self._entries.items()
+                if self.ttl is None or now - stored <= self.ttl
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,196 @@
+""" Columnar (Parquet) storage of the DESA and epitope data frames.
+Set, list, tuple and dict (or Counter) valued columns are flattened into Arrow list / map arrays,
+i.e. one flat values array plus an offsets array per nesting level, and the container
+kind of every level is kept in the file metadata, so the frames are read back with the
+same python objects as the pickles. Scalar fillers of container columns, like the 0
+of the empty Donor_HLAvsnumDESA cells, are stored as empty containers. Readers can project columns and push row filters
+down to the Parquet row groups, so only what a view needs is read from disk.
+
+pyarrow is an optional dependency, it is only imported when a .parquet file is used.
+
+Convert the pickles with
+    python -m app.common.columnar data/desa_3d_view2.pickle data/EpitopevsHLA.pickle
+"""
+import os
+import sys
+import json
+from collections import Counter
+from collections.abc import Mapping, Sequence, Set
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Container kinds in the order they are matched, subclasses before their base classes
+CONTAINERS = {
+    'Counter': Counter, 'dict': dict, 'frozenset': frozenset, 'set': set, 'tuple': tuple, 'list': list,
+}
+# Kind of the containers that are not one of CONTAINERS
+ABSTRACT_CONTAINERS = {Mapping: 'dict', Set: 'set', Sequence: 'list'}
+METADATA_KEY = b'app.containers'
+
+# pandas equivalent of the Parquet filter operators, used for the pickles
+OPERATORS = {
+    '=': lambda series, value: series == value,
+    '==': lambda series, value: series == value,
+    '!=': lambda series, value: series != value,
+    '<': lambda series, value: series < value,
+    '<=': lambda series, value: series <= value,
+    '>': lambda series, value: series > value,
+    '>=': lambda series, value: series >= value,
+    'in': lambda series, value: series.isin(value),
+    'not in': lambda series, value: ~series.isin(value),
+}
+
+
+def import_pyarrow():
+    """ Imports pyarrow on first use """
+    try:
+        import pyarrow as pa # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet as pq # pylint: disable=import-outside-toplevel
+    except ImportError as error:
+        raise ImportError('Reading and writing .parquet files requires pyarrow, pip install pyarrow') from error
+    return pa, pq
+
+
+def _is_container(value) -> bool:
+    return isinstance(value, tuple(ABSTRACT_CONTAINERS)) and not isinstance(value, (str, bytes))
+
+
+def _kind(value) -> str:
+    """ Container kind of one container value """
+    for kind, container in CONTAINERS.items():
+        if isinstance(value, container):
+            return kind
+    return next(kind for container, kind in ABSTRACT_CONTAINERS.items() if isinstance(value, container))
+
+
+def _container_kind(values:list):
+    """ Container kind of the first container cell, None for scalar columns.
+    The other cells of a container column (0, None, NaN, ...) are missing values """
+    for value in values:
+        if _is_container(value):
+            return _kind(value)
+    return None
+
+
+def _is_mapping(kind:str) -> bool:
+    return issubclass(CONTAINERS[kind], dict)
+
+
+def _offsets(values:list) -> np.ndarray:
+    offsets = np.zeros(len(values) + 1, dtype=np.int32)
+    np.cumsum([len(value) if _is_container(value) else 0 for value in values], out=offsets[1:])
+    return offsets
+
+
+def to_arrow(values:list) -> Tuple[object, List[str]]:
+    """ Flattens a column of (nested) containers into an Arrow list / map array.
+    Returns the array and the container kind of every nesting level. Missing cells
+    are stored as empty containers """
+    pa, _ = import_pyarrow()
+    kind = _container_kind(values)
+    if kind is None:
+        # the children of columns of empty containers are typed as strings
+        return pa.array(values, type=None if values else pa.string()), []
+    offsets = pa.array(_offsets(values), type=pa.int32())
+    if _is_mapping(kind):
+        keys, _ = to_arrow([key for value in values if _is_container(value) for key in value])
+        items, item_kinds = to_arrow([item for value in values if _is_container(value) for item in value.values()])
+        return pa.MapArray.from_arrays(offsets, keys, items), [kind, *item_kinds]
+    children, child_kinds = to_arrow([child for value in values if _is_container(value) for child in value])
+    return pa.ListArray.from_arrays(offsets, children), [kind, *child_kinds]
+
+
+def from_arrow(array, kinds:List[str]) -> list:
+    """ Rebuilds the python containers of a column written by to_arrow """
+    if not kinds:
+        return array.to_pylist()
+    # .values is the whole child array, also for slices, so the offsets are used as they are
+    offsets = array.offsets.to_numpy()
+    bounds = zip(offsets[:-1].tolist(), offsets[1:].tolist())
+    flat = array.values
+    container = CONTAINERS[kinds[0]]
+    if _is_mapping(kinds[0]):
+        keys = flat.field(0).to_pylist()
+        items = from_arrow(flat.field(1), kinds[1:])
+        mappings = [dict(zip(keys[start:stop], items[start:stop])) for start, stop in bounds]
+        return mappings if container is dict else [container(mapping) for mapping in mappings]
+    children = from_arrow(flat, kinds[1:])
+    return [container(children[start:stop]) for start, stop in bounds]
+
+
+def write_frame(df:pd.DataFrame, path:str, row_group_size:int=None): # pylint: disable=invalid-name
+    """ Writes a data frame with nested container columns to a .parquet file """
+    pa, pq = import_pyarrow()
+    nested = {column: to_arrow(df[column].tolist()) for column in df.columns if _container_kind(df[column].tolist())}
+    scalars = pa.Table.from_pandas(df.drop(columns=list(nested)), preserve_index=False)
+    # assembled from the arrays, a table without scalar columns has no rows
+    table = pa.Table.from_arrays(
+        [nested[column][0] if column in nested else scalars.column(column) for column in df.columns],
+        names=list(df.columns),
+    )
+    metadata = dict(scalars.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps({column: kinds for column, (_, kinds) in nested.items()}).encode()
+    pq.write_table(table.replace_schema_metadata(metadata), os.path.expanduser(path), row_group_size=row_group_size)
+
+
+def read_parquet(path:str, columns:List[str]=None, filters:list=None) -> pd.DataFrame:
+    """ Reads (a projection of) a .parquet file written by write_frame, memory-mapped
+    filters: Parquet filters on scalar columns, e.g. [('Donor_Type', '=', 'Living')] """
+    _, pq = import_pyarrow()
+    table = pq.read_table(os.path.expanduser(path), columns=columns, filters=filters, memory_map=True)
+    metadata = table.schema.metadata or {}
+    nested = {
+        column: kinds for column, kinds in json.loads(metadata.get(METADATA_KEY, b'{}')).items()
+        if column in table.column_names
+    }
+    df = table.drop(list(nested)).to_pandas() # pylint: disable=invalid-name
+    for column, kinds in nested.items():
+        df[column] = from_arrow(table.column(column).combine_chunks(), kinds)
+    return df[table.column_names]
+
+
+def read_frame(path:str, columns:List[str]=None, filters:list=None) -> pd.DataFrame:
+    """ Reads a data frame from a .parquet file or a pickle. Both accept a column
+    projection and filters, a list of (column, operator, value) that are all applied """
+    if path.endswith('.parquet'):
+        return read_parquet(path, columns, filters)
+    df = pd.read_pickle(os.path.expanduser(path)) # pylint: disable=invalid-name
+    if filters:
+        ind = np.ones(len(df), dtype=bool)
+        for column, operator, value in filters:
+            ind &= OPERATORS[operator](df[column], value).to_numpy(dtype=bool)
+        df = df[ind]
+    return df[columns] if columns else df
+
+
+def freeze(columns:List[str]=None, filters:list=None) -> Tuple[tuple, tuple]:
+    """ Hashable form of a column projection and filters, e.g. for the registry keys """
+    def _value(value):
+        return tuple(value) if isinstance(value, (list, set, frozenset)) else value
+    return (
+        tuple(columns) if columns else None,
+        tuple((column, operator, _value(value)) for column, operator, value in filters) if filters else None,
+    )
+
+
+def thaw(columns:tuple=None, filters:tuple=None) -> Tuple[List[str], list]:
+    """ The projection and filters of freeze in the form read_frame expects """
+    return (
+        list(columns) if columns else None,
+        [(column, operator, list(value) if isinstance(value, tuple) else value) for column, operator, value in filters]
+        if filters else None,
+    )
+
+
+def convert(pickle_path:str, parquet_path:str=None) -> str:
+    """ Converts a pickled data frame into a .parquet file next to it """
+    parquet_path = parquet_path or f'{os.path.splitext(pickle_path)[0]}.parquet'
+    write_frame(pd.read_pickle(os.path.expanduser(pickle_path)), parquet_path)
+    return parquet_path
+
+
+if __name__ == '__main__':
+    for file in sys.argv[1:]:
+        print(f'Converted {file} to {convert(file)}')
@@ -0,0 +1,71 @@
+""" Process wide registry of the reference datasets (DESA, epitope DB, HLA inventory).
+Every dataset is loaded once per process and handed out as a shared, read-only handle.
+The version of the underlying files is checked on every access; when it changed the
+dataset is loaded again and swapped in atomically, while concurrent readers keep
+getting the former version until the new one is ready """
+import os
+import threading
+from typing import Any, Callable, Hashable
+
+from app.common.cache import file_version
+
+
+class DataRegistry:
+    """ Versioned registry of loaded datasets """
+
+    def __init__(self):
+        self.loads = 0
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f""" DataRegistry(datasets={list(self._entries)}, loads={self.loads}) """
+
+    def __contains__(self, key:Hashable):
+        return key in self._entries
+
+    def _key_lock(self, key:Hashable) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def get(self, key:Hashable, loader:Callable[[], Any], version:Callable[[], Hashable]):
+        """
+        Returns the dataset of key, loading it when it is missing or version() changed
+        loader: loads the dataset, its result must be treated as read-only by all consumers
+        version: returns the current version of the underlying data, e.g. file_version(path)
+        """
+        current = version()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == current:
+            return entry[1]
+        lock = self._key_lock(key)
+        if entry is not None and not lock.acquire(blocking=False):
+            # another thread is loading the new version, keep serving the former one
+            return entry[1]
+        if entry is None:
+            lock.acquire()
+        try:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != current:
+                entry = (current, loader())
+                self._entries[key] = entry
+                self.loads += 1
+            return entry[1]
+        finally:
+            lock.release()
+
+    def get_file(self, path:str, loader:Callable[..., Any], *args:Hashable):
+        """ Dataset of one data file, reloaded whenever the file changes
+        args: further hashable arguments of loader(path, *args), part of the key """
+        path = os.path.expanduser(path)
+        key = (loader.__module__, loader.__qualname__, os.path.abspath(path), *args)
+        return self.get(key, lambda: loader(path, *args), lambda: file_version(path))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Process wide registry used by DESA, Epitope and the HLA inventory
+REGISTRY = DataRegistry()
@@ -0,0 +1,38 @@
+""" test file for cache """
+import time
+from app.common.cache import LRUCache, file_version
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.stats == {'hits': 1, 'misses': 1, 'size': 2}
+    cache.set_version(1)
+    assert len(cache) == 0
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_file_version(tmp_path):
+    path = tmp_path / 'EpitopevsHLA.pickle'
+    path.write_bytes(b'v1')
+    version = file_version(str(path))
+    path.write_bytes(b'v1.1')
+    assert file_version(str(path)) != version
+
+
+def test_lru_cache_items():
+    cache = LRUCache()
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.items() == [('a', 1), ('b', 2)]
+    assert cache.stats == {'hits': 0, 'misses': 0, 'size': 2}
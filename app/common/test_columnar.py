@@ -0,0 +1,67 @@
+""" test file for columnar """
+from collections import Counter
+import numpy as np
+import pandas as pd
+import pytest
+from app.common.columnar import _container_kind, freeze, read_frame, thaw, write_frame
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({
+        'TransplantID': [1, 2, 3],
+        'Donor_HLA': [{'A*01:01', 'B*07:02'}, {'A*02:01'}, set()],
+        'EpvsHLA_Donor': [{'62EE': 'A*01:01'}, {}, {'3C': 'B*07:02', '4D': 'B*07:02'}],
+        'PolymorphicResidues': [[('1', 'A')], [('2', 'B'), ('3', 'C')], []],
+        'Donor_Type': pd.Categorical(['Living', 'Deceased', 'Deceased']),
+        'Survival[Y]': [0.1, 12.0, 3.0],
+    })
+
+
+def test_read_pickle_with_projection_and_filters(df, tmp_path):
+    path = str(tmp_path / 'desa.pickle')
+    df.to_pickle(path)
+    frame = read_frame(path, columns=['TransplantID'], filters=[('Donor_Type', '=', 'Deceased'), ('Survival[Y]', '<', 5)])
+    assert frame.TransplantID.tolist() == [3]
+
+
+def test_parquet_round_trip(df, tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'desa.parquet')
+    write_frame(df, path, row_group_size=1)
+    frame = read_frame(path)
+    for column in df.columns:
+        assert frame[column].tolist() == df[column].tolist()
+    assert isinstance(frame.Donor_Type.dtype, pd.CategoricalDtype)
+
+    frame = read_frame(path, columns=['TransplantID', 'EpvsHLA_Donor'], filters=[('Donor_Type', '=', 'Deceased')])
+    assert list(frame.columns) == ['TransplantID', 'EpvsHLA_Donor']
+    assert frame.EpvsHLA_Donor.tolist() == [{}, {'3C': 'B*07:02', '4D': 'B*07:02'}]
+    assert np.array_equal(frame.TransplantID, [2, 3])
+
+
+def test_container_kind():
+    assert _container_kind([0, Counter({'A*01:01': 2})]) == 'Counter'
+    assert _container_kind([None, frozenset({'62EE'})]) == 'frozenset'
+    assert _container_kind([0, 0]) is None
+    assert _container_kind(['A*01:01', 'B*07:02']) is None
+
+
+def test_parquet_round_trip_counters(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'desa.parquet')
+    counters = [Counter({'A*01:01': 2, 'B*07:02': 1}), Counter({'A*02:01': 3})]
+    write_frame(pd.DataFrame({'Donor_HLAvsnumDESA': counters}), path)
+    frame = read_frame(path)
+    assert frame.Donor_HLAvsnumDESA.tolist() == counters
+    assert all(isinstance(value, Counter) for value in frame.Donor_HLAvsnumDESA)
+
+    # transplants without DESA hold a 0 instead of an empty Counter
+    write_frame(pd.DataFrame({'Donor_HLAvsnumDESA': [counters[0], 0, counters[1]]}), path)
+    assert read_frame(path).Donor_HLAvsnumDESA.tolist() == [counters[0], Counter(), counters[1]]
+
+
+def test_freeze():
+    columns, filters = freeze(['TransplantID'], [('Donor_Type', 'in', ['Living'])])
+    assert hash((columns, filters)) and thaw(columns, filters) == (['TransplantID'], [('Donor_Type', 'in', ['Living'])])
+    assert freeze() == (None, None) and thaw() == (None, None)
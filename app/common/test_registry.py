@@ -0,0 +1,37 @@
+""" test file for registry """
+import os
+from app.common.registry import DataRegistry
+from app.common.cache import dir_version
+
+
+def read_text(path):
+    with open(path) as infile:
+        return infile.read()
+
+
+def test_registry_reloads_changed_file(tmp_path):
+    path = tmp_path / 'desa.txt'
+    path.write_text('v1')
+    registry = DataRegistry()
+    assert registry.get_file(str(path), read_text) == 'v1'
+    assert registry.get_file(str(path), read_text) == 'v1'
+    assert registry.loads == 1
+    path.write_text('v1.1')
+    assert registry.get_file(str(path), read_text) == 'v1.1'
+    assert registry.loads == 2
+
+
+def test_registry_serves_former_version_while_loading():
+    registry = DataRegistry()
+    assert registry.get('key', lambda: 'v1', lambda: 1) == 'v1'
+    lock = registry._key_lock('key') # pylint: disable=protected-access
+    with lock:
+        assert registry.get('key', lambda: 'v2', lambda: 2) == 'v1'
+    assert registry.get('key', lambda: 'v2', lambda: 2) == 'v2'
+
+
+def test_dir_version(tmp_path):
+    os.makedirs(tmp_path / 'A')
+    version = dir_version(str(tmp_path))
+    (tmp_path / 'A' / 'A_01_01_V1.pdb').write_text('')
+    assert dir_version(str(tmp_path)) != version
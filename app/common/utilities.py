@@ -3,6 +3,8 @@ import os
 from collections import defaultdict
 import pandas as pd
 import regex as re
+from app.common.cache import dir_version
+from app.common.registry import REGISTRY
 # from typing import Set
 
 def flatten2list(object):
@@ -40,7 +42,7 @@ def get_hla_polychain(hla:str)-> str:
 
 def polymorphic_residues(epitope_set:set, epitope_db) -> set:
     """ Find the aminoacide sequence of each epitope """
-    ind = epitope_db.Epitope.apply(lambda x: x in epitope_set)
+    ind = epitope_db.Epitope.isin(epitope_set)
     poly_residues = epitope_db[ind].PolymorphicResidues.values
     return flatten2list(poly_residues)
 
@@ -112,3 +114,12 @@ def get_inventory_hlas(base_dir: str) -> dict:
                 for file in os.scandir(entry.path):
                     hla_dict[entry.name].update(get_hla_from_filename(file.name))
     return hla_dict
+
+def load_pdb_inventory(base_dir: str='./data/HLAMolecule') -> frozenset:
+    """ All the hlas with a .pdb file in the hla inventory, the directory is walked
+    once per process and again only when a file is added or removed """
+    return REGISTRY.get(
+        ('pdb_inventory', os.path.abspath(os.path.expanduser(base_dir))),
+        lambda: frozenset(flatten_dict_values(get_inventory_hlas(base_dir))),
+        lambda: dir_version(base_dir),
+    )
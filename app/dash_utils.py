@@ -6,36 +6,39 @@ from dash import no_update
 import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
-from app.desa import DESA
-
-def filtering_logic(desa: DESA, sort_by:str, hla_class:str, hla:str, donor_type:str, exclude_nev:bool):
-    """ This function wraps all the logic pertain to filtering the table """
-    if donor_type:
-        desa.donor_type(donor_type)
-    if exclude_nev:
-        desa.graft_function(exclude='NEV')
-    if hla_class:
-        desa.hla_class(hla_class)
-    if hla:
-        desa.tx_with_hla(hla)
-    if sort_by:
-        if sort_by == 'early_failure':
-            desa.early_failed(1/4)
-        if sort_by == 'late_surviving':
-            desa.late_failed(10)
-        if sort_by == 'desa':
-            return desa.df.sort_values(by='#DESA', ascending=False)
-    return desa.df
-
+import dash_table
+from app.desa import TABLE_COLUMNS, build_display
+from app.tx_table import PAGE_SIZE, page_count, filtering_logic # pylint: disable=unused-import
 
 def dashtable_data_compatibility(df):
     """ This function helps to make the data compatible to dash table
-    by turning all unstructured values into a string """
-    df['Survival[Y]'] = df['Survival[Y]'].apply(lambda x: round(x,3))
-    df['Donor_HLAvsnumDESA'] = df['Donor_HLAvsnumDESA'].apply(lambda x: str(dict(x)))
-    df['Donor_HLA'] = df['Donor_HLA'].apply(str)
-    df['Donor_HLA_Class'] = df['Donor_HLA_Class'].apply(str)
-    return df[['TransplantID', '#DESA', 'Failure', 'Survival[Y]', 'Donor_HLA', 'Donor_HLA_Class']]
+    by turning all unstructured values into a string. The input df is not
+    changed. The table callbacks use the display columns that DESA precomputes
+    at load time, see DESA.get_txs(display=True) """
+    return build_display(df)
+
+def paginated_table(token:str, filters:tuple, records:list, n_records:int, page_size:int=PAGE_SIZE):
+    """ DataTable whose pages and sorting are served by the update_table_page callback.
+    The token of the cached TransplantIDs and the normalised filters they were computed
+    from are kept in the browser next to the table, so any worker can serve a page """
+    return html.Div([
+        dcc.Store(id='tx-table-token', data={'token': token, 'filters': list(filters)}),
+        dash_table.DataTable(
+            id='tx-datatable',
+            columns=[{'name': column, 'id': column} for column in TABLE_COLUMNS],
+            data=records,
+            page_current=0,
+            page_size=page_size,
+            page_count=page_count(n_records, page_size),
+            page_action='custom',
+            sort_action='custom',
+            sort_mode='single',
+            sort_by=[],
+            style_header={'fontWeight': 'bold'},
+            style_cell={'textAlign': 'left', 'fontSize': 13},
+            style_data_conditional=[{'if': {'row_index': 'odd'}, 'backgroundColor': '#f5f5f5'}],
+        ),
+    ])
 
 def Header(name):
     title = html.H1(name, style={"margin-top": 5})
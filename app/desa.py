@@ -1,13 +1,99 @@
 """ DESA class """
+from typing import Dict, List, Tuple
+import numpy as np
 import pandas as pd
+from app.common.registry import REGISTRY
+from app.common.columnar import freeze, read_frame, thaw
 # from app.epitope import Epitope
 
+# Low cardinality columns stored as categoricals
+CATEGORICAL_COLUMNS = ['Donor_Type', 'Donor_HLA_Class', 'Graft_Func']
+DONOR_TYPES = ['Living', 'Deceased']
+HLA_CLASSES = ['I', 'II', 'I,II']
+DESA_PATH = './data/desa_3d_view2.pickle'
+
+# Columns of the transplant table and their display format, the others are shown as they are
+TABLE_COLUMNS = ['TransplantID', '#DESA', 'Failure', 'Survival[Y]', 'Donor_HLA', 'Donor_HLA_Class']
+DISPLAY_FORMATS = {
+    'Survival[Y]': lambda x: round(x, 3),
+    'Donor_HLA': str,
+    'Donor_HLA_Class': str,
+}
+
+# Vectorized predicates of the DESA filters over (a subset of) the DESA frame
+PREDICATES = {
+    'donor_type': lambda df, donor_type: df.Donor_Type == donor_type,
+    'graft_function': lambda df, exclude: (df.Graft_Func != exclude) & (df['Survival[Y]'] != 0),
+    'hla_class': lambda df, hla_class: df.Donor_HLA_Class == hla_class,
+    'early_failed': lambda df, threshold: (df['Survival[Y]'] < threshold) & (df.Failure == 1),
+    'late_failed': lambda df, threshold: (df['Survival[Y]'] > threshold) & (df.Failure != 1),
+    'desa_num': lambda df, num: df['#DESA'] == num,
+}
+
+
+def build_hla_index(df:pd.DataFrame) -> Dict[str, np.ndarray]: # pylint: disable=invalid-name
+    """ Membership index of the set valued Donor_HLA column
+    { 'HLA': array of the row positions of the transplants with that donor HLA } """
+    if 'Donor_HLA' not in df:
+        return {}
+    exploded = pd.DataFrame({
+        'position': np.arange(len(df)),
+        'HLA': df['Donor_HLA'].map(list).to_numpy(),
+    }).explode('HLA').dropna()
+    return {hla: positions.to_numpy() for hla, positions in exploded.groupby('HLA').position}
+
+
+def build_tx_index(df:pd.DataFrame) -> Dict[int, np.ndarray]: # pylint: disable=invalid-name
+    """ { TransplantID: array of the row positions of that transplant } """
+    if 'TransplantID' not in df:
+        return {}
+    return df.groupby('TransplantID', sort=False).indices
+
+
+def build_display(df:pd.DataFrame) -> pd.DataFrame: # pylint: disable=invalid-name
+    """ The table columns of df formatted for display, the rows are aligned with df """
+    return pd.DataFrame({
+        column: df[column].astype(object).map(DISPLAY_FORMATS[column]) if column in DISPLAY_FORMATS else df[column]
+        for column in TABLE_COLUMNS if column in df
+    }, index=df.index)
+
+
+def read_desa_db(path:str,
+                 columns:tuple=None,
+                 filters:tuple=None) -> Tuple[pd.DataFrame, Dict[str, np.ndarray], Dict[int, np.ndarray], pd.DataFrame]:
+    """ Reads (a projection of) the DESA pickle or its .parquet conversion, builds its HLA and
+    TransplantID indexes and formats the table columns for display. columns and filters are
+    the frozen projection and filters of read_frame (see columnar.freeze) """
+    df = read_frame(path, *thaw(columns, filters)) # pylint: disable=invalid-name
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    return df, build_hla_index(df), build_tx_index(df), build_display(df)
+
+
+def load_desa_db(path:str,
+                 columns:List[str]=None,
+                 filters:list=None) -> Tuple[pd.DataFrame, Dict[str, np.ndarray], Dict[int, np.ndarray], pd.DataFrame]:
+    """ The DESA frame, its indexes and display columns from the process wide registry, loaded
+    once per file version and projection. All are shared by the DESA objects and must be treated
+    as read-only """
+    return REGISTRY.get_file(path, read_desa_db, *freeze(columns, filters))
+
 class DESA:
     """ This is a class that entails the data base [Pandas DataFrame] of all transplants
-        with DESA and all the related methods that can be applied or update this DataFrame """
-
-    def __init__(self, path:str='./data/desa_3d_view2.pickle'):
-        self.df = pd.read_pickle(path)
+        with DESA and all the related methods that can be applied or update this DataFrame.
+        Filters are combined into one boolean mask over the shared frame, the filtered
+        df is only selected when it is used """
+
+    def __init__(self, path:str=DESA_PATH, columns:List[str]=None, filters:list=None):
+        """
+        columns: only read these columns, all by default
+        filters: only read the rows that pass these (column, operator, value) filters,
+        they are pushed down to the Parquet row groups (see columnar.read_frame)
+        """
+        self.base, self.hla_index, self.tx_index, self.display = load_desa_db(path, columns, filters)
+        self.mask = np.ones(len(self.base), dtype=bool)
+        self._df = None
 
     def __repr__(self):
         return f""" DESA_DB(records={len(self.df)}, columns={self.df.columns}) """
@@ -15,56 +101,70 @@ class DESA:
     def __str__(self):
         return self.__repr__()
 
+    @property
+    def df(self) -> pd.DataFrame: # pylint: disable=invalid-name
+        if self._df is None:
+            self._df = self.base if self.mask.all() else self.base[self.mask]
+        return self._df
+
+    def _filter(self, ind):
+        """ Combines a boolean mask over the base frame with the former filters """
+        self.mask = self.mask & np.asarray(ind, dtype=bool)
+        self._df = None
+        return self
+
     def donor_type(self, donor_type:str='Deceased'):
-        if donor_type not in ['Living', 'Deceased']:
+        if donor_type not in DONOR_TYPES:
             raise KeyError(f"""{donor_type} does not exist in the df values,
-                            accepted values: {self.df.Donor_Type.unique()}""")
-        ind = self.df.Donor_Type.apply(lambda x: x == donor_type)
-        self.df = self.df[ind]
-        return self
+                            accepted values: {self.base.Donor_Type.unique()}""")
+        return self._filter(PREDICATES['donor_type'](self.base, donor_type))
 
     def graft_function(self, exclude='NEV'):
-        self.df = self.df[self.df.Graft_Func != exclude]
-        self.df = self.df[self.df['Survival[Y]'] != 0]
-        return self
+        return self._filter(PREDICATES['graft_function'](self.base, exclude))
 
     def get_tx(self, TxID:int) -> pd.DataFrame:
-        ind = self.df.TransplantID == TxID
-        if sum(ind) == 0:
-            raise ValueError(f'Transplant ID {TxID} does not exist in the datat set')
-        else:
-            return self.df[ind]
+        return self.get_txs([TxID])
+
+    def get_txs(self, TxIDs, display:bool=False) -> pd.DataFrame:
+        """ Rows of the given transplants in the current filter state, in the order of TxIDs,
+        selected at once from the TransplantID index. All the missing IDs are reported together
+        display: returns the precomputed display columns of the table instead of the raw rows """
+        positions, missing = [], []
+        for TxID in TxIDs:
+            rows = self.tx_index.get(TxID, np.empty(0, dtype=np.intp))
+            rows = rows[self.mask[rows]]
+            if len(rows) == 0:
+                missing.append(TxID)
+            positions.append(rows)
+        if missing:
+            raise ValueError(f'Transplant IDs {missing} do not exist in the data set')
+        frame = self.display if display else self.base
+        return frame.iloc[np.concatenate(positions) if positions else []]
+
+    def tx_ids(self, TxIDs):
+        """ Filter the transplants with the given TransplantIDs """
+        return self._filter(self.base.TransplantID.isin(TxIDs).to_numpy())
 
     def tx_with_hla(self, hla):
         """ Filter transplants with specific hla """
-        ind = self.df['Donor_HLA'].apply(lambda x: hla in x)
-        self.df = self.df[ind]
-        return self
+        ind = np.zeros(len(self.base), dtype=bool)
+        ind[self.hla_index.get(hla, [])] = True
+        return self._filter(ind)
 
     def hla_class(self, hla_class):
-        if hla_class not in ['I', 'II', 'I,II']:
+        if hla_class not in HLA_CLASSES:
             raise KeyError(f"""{hla_class} does not exist in the df,
-                            accepted values are: {self.df.Donor_HLA_Class.unique()}""")
-        ind = self.df.Donor_HLA_Class.apply(lambda x: x == hla_class)
-        self.df = self.df[ind]
-        return self
+                            accepted values are: {self.base.Donor_HLA_Class.unique()}""")
+        return self._filter(PREDICATES['hla_class'](self.base, hla_class))
 
     def early_failed(self, threshold):
-        ind_t = self.df['Survival[Y]'].apply(lambda x: x < threshold)
-        ind_e = self.df.Failure.apply(lambda x: x == 1)
-        self.df = self.df[ind_t & ind_e]
-        return self
+        return self._filter(PREDICATES['early_failed'](self.base, threshold))
 
     def late_failed(self, threshold):
-        ind_t = self.df['Survival[Y]'].apply(lambda x: x > threshold)
-        ind_e = self.df.Failure.apply(lambda x: x != 1 )
-        self.df = self.df[ind_t & ind_e]
-        return self
+        return self._filter(PREDICATES['late_failed'](self.base, threshold))
 
     def desa_num(self, num):
-        ind = self.df['#DESA'].apply(lambda x: x == num)
-        self.df = self.df[ind]
-        return self
+        return self._filter(PREDICATES['desa_num'](self.base, num))
 
 if __name__ == '__main__':
     desa = DESA()
@@ -72,4 +172,3 @@ if __name__ == '__main__':
 
 
     print(desa.df.columns)
-
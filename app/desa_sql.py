@@ -0,0 +1,118 @@
+""" SQLite backend of the DESA table. The scalar columns of the DESA frame are loaded
+into an in-memory SQLite database with indexes on the filter columns, and the set valued
+Donor_HLA column into a transplant <-> HLA junction table. The filters of the table view
+are compiled into one parameterised query that returns the row positions of the matching
+transplants, which are then selected from the shared DESA frame """
+import os
+import sqlite3
+import threading
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.common.registry import REGISTRY
+from app.desa import DESA_PATH, DONOR_TYPES, HLA_CLASSES, load_desa_db
+
+# DESA column -> SQL column of the transplants table
+SQL_COLUMNS = {
+    'TransplantID': 'tx_id',
+    'Donor_Type': 'donor_type',
+    'Donor_HLA_Class': 'hla_class',
+    'Graft_Func': 'graft_func',
+    'Survival[Y]': 'survival',
+    'Failure': 'failure',
+    '#DESA': 'n_desa',
+}
+INDEXED_COLUMNS = ['tx_id', 'donor_type', 'hla_class', 'survival']
+
+
+def build_database(df:pd.DataFrame) -> sqlite3.Connection: # pylint: disable=invalid-name
+    """ Loads the DESA frame into a new in-memory database """
+    connection = sqlite3.connect(':memory:', check_same_thread=False)
+    columns = [column for column in SQL_COLUMNS if column in df]
+    transplants = pd.DataFrame({SQL_COLUMNS[column]: df[column].astype(object).to_numpy() for column in columns})
+    transplants.insert(0, 'position', np.arange(len(df)))
+    transplants = transplants.astype(object).where(transplants.notna(), None)
+    connection.execute(f"CREATE TABLE transplants ({', '.join(transplants.columns)}, PRIMARY KEY (position))")
+    connection.executemany(
+        f"INSERT INTO transplants VALUES ({', '.join('?' * len(transplants.columns))})",
+        transplants.itertuples(index=False, name=None),
+    )
+    connection.execute('CREATE TABLE transplant_hla (hla TEXT, position INTEGER)')
+    connection.executemany(
+        'INSERT INTO transplant_hla VALUES (?, ?)',
+        ((hla, position) for position, hlas in enumerate(df['Donor_HLA']) for hla in hlas),
+    )
+    for column in INDEXED_COLUMNS:
+        if column in transplants:
+            connection.execute(f'CREATE INDEX idx_{column} ON transplants ({column})')
+    connection.execute('CREATE INDEX idx_hla ON transplant_hla (hla, position)')
+    connection.commit()
+    return connection
+
+
+def compile_filters(sort_by:str=None,
+                    hla_class:str=None,
+                    hla:str=None,
+                    donor_type:str=None,
+                    exclude_nev:bool=None) -> Tuple[str, list]:
+    """ Compiles the table filters of dash_utils.filtering_logic into one query that
+    selects the row positions of the matching transplants. Returns the sql and its parameters """
+    conditions, parameters = [], []
+    if donor_type:
+        if donor_type not in DONOR_TYPES:
+            raise KeyError(f'{donor_type} does not exist in the df values, accepted values: {DONOR_TYPES}')
+        conditions.append('donor_type = ?')
+        parameters.append(donor_type)
+    if exclude_nev:
+        # IS NOT keeps the missing values, like the pandas != of DESA.graft_function
+        conditions.append('graft_func IS NOT ? AND survival IS NOT 0')
+        parameters.append('NEV')
+    if hla_class:
+        if hla_class not in HLA_CLASSES:
+            raise KeyError(f'{hla_class} does not exist in the df, accepted values are: {HLA_CLASSES}')
+        conditions.append('hla_class = ?')
+        parameters.append(hla_class)
+    if hla:
+        conditions.append('position IN (SELECT position FROM transplant_hla WHERE hla = ?)')
+        parameters.append(hla)
+    order_by = 'position'
+    if sort_by == 'early_failure':
+        conditions.append('survival < ? AND failure = 1')
+        parameters.append(1/4)
+    if sort_by == 'late_surviving':
+        conditions.append('survival > ? AND failure IS NOT 1')
+        parameters.append(10)
+    if sort_by == 'desa':
+        order_by = 'n_desa DESC, position'
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'SELECT position FROM transplants{where} ORDER BY {order_by}', parameters
+
+
+class DesaSQL:
+    """ DESA table backed by SQLite, the database is built once per loaded DESA frame """
+
+    def __init__(self, path:str=DESA_PATH):
+        path = os.path.expanduser(path)
+        base, _, _, _ = load_desa_db(path)
+        # keyed on the frame itself rather than on the file version: while the registry
+        # reloads the file it can still hand out the former frame. The entry keeps its
+        # frame alive, so the id is not reused, and the positions of the connection are
+        # always taken from the frame it was built from
+        self.base, self.connection, self._lock = REGISTRY.get(
+            ('desa_sql', os.path.abspath(path)),
+            lambda: (base, build_database(base), threading.Lock()),
+            lambda: id(base),
+        )
+
+    def __repr__(self):
+        return f""" DESA_SQL(records={len(self.base)}) """
+
+    def positions(self, sql:str, parameters:list) -> List[int]:
+        with self._lock:
+            return [position for (position,) in self.connection.execute(sql, parameters)]
+
+    def filter(self, sort_by:str=None, hla_class:str=None, hla:str=None, donor_type:str=None, exclude_nev:bool=None) -> pd.DataFrame:
+        """ Rows of the transplants that pass the filters, in the requested order """
+        return self.base.iloc[self.positions(*compile_filters(sort_by, hla_class, hla, donor_type, exclude_nev))]
@@ -1,26 +1,159 @@
 """ This file contains all the methods consumed by Epitope Data Base """
 import os
-from typing import Union, List
+from typing import Union, List, Tuple
 from collections import defaultdict
+import numpy as np
 import pandas as pd
 from app.common.logger import logging, get_logger
+from app.common.registry import REGISTRY
+from app.common.cache import LRUCache
+from app.common.columnar import freeze, read_frame, thaw
+from app.set_cover import greedy_cover, exact_cover, uncovered_targets
 from app.common.utilities import (
-    get_inventory_hlas,
+    load_pdb_inventory,
     flatten2list,
-    flatten2set,
-    flatten_dict_values,
 )
 
+# HLA of highest frequency, see https://www.allelefrequencies.net
+FREQUENT_HLA = {
+    'A*02:01', 'A*01:01', 'A*03:01', #'A*24:02', 'A*11:01', 'A*68:01', 'A*31:01', 'A*32:01', 'A*26:01', 'A*29:02',
+    'B*07:02', 'B*08:01', 'B*15:01', #'B*44:02', 'B*40:01', 'B*35:01', 'B*51:01', 'B*44:03', 'B*57:01', 'B*18:01',
+    'DRB1*15:01', 'DRB1*03:01', 'DRB1*01:01', #'DRB1*07:01', 'DRB1*04:01', 'DRB1*13:01', 'DRB1*11:01', 'DRB1*13:02', 'DRB1*04:04', 'DRB1*14:54',
+    'DQB1*03:01', 'DQB1*06:02', 'DQB1*02:01', #'DQB1*05:01', 'DQB1*03:02', 'DQB1*02:02', 'DQB1*06:03', 'DQB1*06:04', 'DQB1*03:03', 'DQB1*05:03',
+}
+
+# Low cardinality columns stored as categoricals
+CATEGORICAL_COLUMNS = ['mAb', 'isotype', 'ElliPro Score']
+
+# Process wide inverted indexes keyed on (id of the base frame, query key, allele column),
+# the entries hold their base frame so its id is not reused while they are cached
+INVERTED_INDEXES = LRUCache(maxsize=64)
+
+
+def build_lookups(df:pd.DataFrame) -> dict: # pylint: disable=invalid-name
+    """ Epitope keyed hash indexes of the per epitope attributes, the first record wins
+    { 'PolymorphicResidues': {epitope: (residues)}, 'isotype': {epitope: isotype},
+      'ElliPro Score': {epitope: score}, 'mAb': {epitope: bool} } """
+    if 'Epitope' not in df:
+        return {}
+    records = df.drop_duplicates('Epitope')
+    epitopes = records.Epitope.tolist()
+    lookups = {}
+    if 'PolymorphicResidues' in records:
+        lookups['PolymorphicResidues'] = dict(zip(epitopes, map(tuple, records.PolymorphicResidues)))
+    for column in ['isotype', 'ElliPro Score']:
+        if column in records:
+            lookups[column] = dict(zip(epitopes, records[column].astype(object).tolist()))
+    if 'mAb' in records:
+        lookups['mAb'] = dict(zip(epitopes, (records.mAb == 'Yes').tolist()))
+    return lookups
+
+
+def read_epitope_db(path:str, columns:tuple=None, filters:tuple=None) -> Tuple[pd.DataFrame, dict]:
+    """ Reads (a projection of) the epitope pickle or its .parquet conversion and builds its
+    lookups. columns and filters are the frozen projection and filters of read_frame (see columnar.freeze) """
+    df = read_frame(path, *thaw(columns, filters)) # pylint: disable=invalid-name
+    for column in CATEGORICAL_COLUMNS:
+        if column in df:
+            df[column] = df[column].astype('category')
+    return df, build_lookups(df)
+
+
+def load_epitope_db(path:str, columns:List[str]=None, filters:list=None) -> Tuple[pd.DataFrame, dict]:
+    """ The epitope frame and its lookups from the process wide registry, loaded once per
+    file version and projection. Both are shared by all the Epitope objects and must be treated
+    as read-only """
+    return REGISTRY.get_file(path, read_epitope_db, *freeze(columns, filters))
+
+
+class EpitopeQuery:
+    """ Immutable query on a shared epitope frame. Every filter returns a new query that
+    carries one more predicate; all predicates are evaluated as one vectorized boolean mask
+    when the filtered frame is first needed. The base frame is never copied or changed """
+
+    def __init__(self, base:pd.DataFrame, predicates:tuple=()):
+        self.base = base
+        self.predicates = predicates
+        self._df = None
+
+    def __repr__(self):
+        return f""" EpitopeQuery(predicates={self.predicates}) """
+
+    def where(self, column:str, operator:str, value) -> 'EpitopeQuery':
+        """ operator: '==', 'isin' or 'contains' (substring) """
+        return EpitopeQuery(self.base, self.predicates + ((column, operator, value),))
+
+    def mAb(self) -> 'EpitopeQuery': # pylint: disable=invalid-name
+        return self.where('mAb', '==', 'Yes')
+
+    def isotype(self, isotype:str='IgG') -> 'EpitopeQuery':
+        return self.where('isotype', 'contains', isotype)
+
+    def epitopes(self, value:Union[str, List[str]]) -> 'EpitopeQuery':
+        if isinstance(value, str):
+            return self.where('Epitope', '==', value)
+        return self.where('Epitope', 'isin', list(value))
+
+    def ellipro(self, value:Union[str, List[str]]) -> 'EpitopeQuery':
+        if isinstance(value, str):
+            value = [value]
+        return self.where('ElliPro Score', 'isin', list(value))
+
+    def _predicate_mask(self, column:str, operator:str, value) -> np.ndarray:
+        series = self.base[column]
+        if operator == '==':
+            return (series == value).to_numpy(dtype=bool)
+        if operator == 'isin':
+            return series.isin(value).to_numpy(dtype=bool)
+        if operator == 'contains':
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                # test the categories once and match the rows through them
+                categories = series.cat.categories
+                matched = categories[[value in category for category in categories]]
+                return series.isin(matched).to_numpy(dtype=bool)
+            return series.map(lambda x: value in x).to_numpy(dtype=bool)
+        raise ValueError(f'Operator {operator} is not supported')
+
+    @property
+    def key(self) -> tuple:
+        """ Hashable form of the predicates """
+        def _value(value):
+            if isinstance(value, (set, frozenset)):
+                return frozenset(value)
+            return tuple(value) if isinstance(value, list) else value
+        return tuple((column, operator, _value(value)) for column, operator, value in self.predicates)
+
+    def mask(self) -> np.ndarray:
+        """ Boolean mask of all predicates over the base frame """
+        mask = np.ones(len(self.base), dtype=bool)
+        for predicate in self.predicates:
+            mask &= self._predicate_mask(*predicate)
+        return mask
+
+    @property
+    def df(self) -> pd.DataFrame: # pylint: disable=invalid-name
+        """ The filtered frame, computed once per query """
+        if self._df is None:
+            self._df = self.base if not self.predicates else self.base[self.mask()]
+        return self._df
+
+
 class Epitope:
     """ This is a class that entails the data base [Pandas DataFrame] of all epitopes and
         all the related methods tha can be applied to this data base  """
 
-    def __init__(self, path:str='./data/EpitopevsHLA.pickle'):
+    def __init__(self, path:str='./data/EpitopevsHLA.pickle', columns:List[str]=None, filters:list=None):
+        """
+        columns: only read these columns, all by default
+        filters: only read the rows that pass these (column, operator, value) filters,
+        they are pushed down to the Parquet row groups (see columnar.read_frame)
+        """
         # the path is consistent if dash_hla_3d/app.py is ran
         self.path = os.path.expanduser(path)
         # Get hlas with pdb files
-        self.pdb_inventory = flatten_dict_values(get_inventory_hlas('./data/HLAMolecule'))
-        self.df = pd.read_pickle(self.path) # pylint: disable=invalid-name
+        self.pdb_inventory = load_pdb_inventory('./data/HLAMolecule')
+        base, self.lookups = load_epitope_db(self.path, columns, filters)
+        self.query = EpitopeQuery(base)
         self._hlavsep = None
         self._hlavsep_df = None
         self.log = get_logger('Epitope', logging.INFO)
@@ -28,6 +161,57 @@ class Epitope:
     def __repr__(self):
         return f""" Epitope_DB(records={len(self.df)}, columns={self.df.columns}) """
 
+    @property
+    def query(self) -> EpitopeQuery:
+        return self._query
+
+    @query.setter
+    def query(self, value:EpitopeQuery):
+        """ Every filter replaces the query, the indexes of the former filter state are dropped """
+        self._query = value
+        self._indexes = {}
+
+    @property
+    def df(self) -> pd.DataFrame: # pylint: disable=invalid-name
+        return self.query.df
+
+    @df.setter
+    def df(self, value:pd.DataFrame): # pylint: disable=invalid-name
+        self.lookups = build_lookups(value)
+        self.query = EpitopeQuery(value)
+
+    def _inverted_index(self, hla_allel:str='Luminex Alleles'):
+        """ Builds the allele -> epitopes and epitope -> alleles maps of the current
+        filter state in one pass over the exploded allele column. The maps are shared
+        by all the Epitope objects on the same base frame and filters, and must not be changed """
+        key = ('inverted', hla_allel)
+        if key not in self._indexes:
+            base = self.query.base
+            shared_key = (id(base), self.query.key, hla_allel)
+            cached = INVERTED_INDEXES.get(shared_key)
+            if cached is None or cached[0] is not base:
+                exploded = self.df[['Epitope', hla_allel]].explode(hla_allel).dropna()
+                allele_to_epitopes = exploded.groupby(hla_allel)['Epitope'].agg(set).to_dict()
+                epitope_to_alleles = exploded.groupby('Epitope')[hla_allel].agg(set).to_dict()
+                cached = (base, (allele_to_epitopes, epitope_to_alleles))
+                INVERTED_INDEXES.set(shared_key, cached)
+            self._indexes[key] = cached[1]
+        return self._indexes[key]
+
+    def allele_to_epitopes(self, hla_allel:str='Luminex Alleles') -> dict:
+        """ { 'HLA' : {'epitopes'} } of the current filter state """
+        return self._inverted_index(hla_allel)[0]
+
+    def epitope_to_alleles(self, hla_allel:str='Luminex Alleles') -> dict:
+        """ { 'epitope' : {'HLA'} } of the current filter state """
+        return self._inverted_index(hla_allel)[1]
+
+    def epitopes(self) -> set:
+        """ All the epitopes of the current filter state """
+        if 'epitopes' not in self._indexes:
+            self._indexes['epitopes'] = set(self.df.Epitope.values.tolist())
+        return self._indexes['epitopes']
+
     @staticmethod
     def epvshla2hlavsep(epvshla:dict) -> dict:
         """ Transform an ep vs hla dict 2 hla vs ep dict """
@@ -37,8 +221,7 @@ class Epitope:
         return hlavsep
 
     def filter_mAb(self):
-        ind = self.df.mAb == 'Yes'
-        self.df = self.df[ind]
+        self.query = self.query.mAb()
         return self
 
     def is_IgG(self):
@@ -49,28 +232,19 @@ class Epitope:
             return False
 
     def isotype(self, isotype:str='IgG'):
-        ind = self.df.isotype.apply(lambda x: isotype in x)
-        self.df = self.df[ind]
+        self.query = self.query.isotype(isotype)
         return self
 
     def get_epitopes(self, value:Union[str, List[str]]):
         """ get epitope info from the df
         value: can be str or a list of strings """
-
-        if isinstance(value, str):
-            ind = self.df.Epitope == value
-        else:
-            ind = self.df.Epitope.apply(lambda x: x in value)
-        self.df = self.df[ind]
+        self.query = self.query.epitopes(value)
         return self
 
-    def ellipro(self, value):
-        """ filter EpitopeDB based on desired ellipro score """
-        if isinstance(value, str):
-            ind = self.df.Epitope == value
-        else:
-            ind = self.df['ElliPro Score'].apply(lambda x: x in value)
-        self.df = self.df[ind]
+    def ellipro(self, value:Union[str, List[str]]):
+        """ filter EpitopeDB based on desired ellipro score
+        value: can be str or a list of strings """
+        self.query = self.query.ellipro(value)
         return self
 
     def hlavsep(self,
@@ -84,61 +258,63 @@ class Epitope:
         only_with_pdb: Include only Luminex Alleles that pdb file is available
         { 'HLA' : {'epitopes'}} """
 
+        allele_to_epitopes = self.allele_to_epitopes(hla_allel)
         if only_with_pdb:
             # Luminex Alleles with available pdb files
-            hlas = flatten2set(self.df[hla_allel].values).intersection(self.pdb_inventory) - ignore_hla
+            hlas = allele_to_epitopes.keys() & self.pdb_inventory - ignore_hla
         else:
-            hlas = flatten2set(self.df[hla_allel].values)
+            hlas = allele_to_epitopes.keys()
 
         hlavsep_dict = defaultdict(list)
-        for hla in hlas:
-            ind = self.df[hla_allel].apply(lambda x: hla in x)
-            epitopes = flatten2set(self.df[ind]['Epitope'].values)
+        for hla in sorted(hlas):
             hlavsep_dict['HLA'].append(hla)
-            hlavsep_dict['Epitope'].append(epitopes)
+            hlavsep_dict['Epitope'].append(set(allele_to_epitopes[hla]))
         self._hlavsep_df = pd.DataFrame(hlavsep_dict)
         return self._hlavsep_df
 
-    def polymorphic_residues(self, epitope:str) -> set:
+    def lookup(self, epitope:str, column:str):
+        """ Value of a column for one epitope of the current filter state from the
+        prebuilt lookups, raises IndexError if the epitope is not in the filter state """
+        if epitope not in self.epitopes():
+            raise IndexError(f'Epitope {epitope} is not in the epitope database')
+        return self.lookups[column][epitope]
+
+    def polymorphic_residues(self, epitope:str) -> tuple:
         """ Gets the aminoacide sequence of one epitope from
         the polymorphic residue column """
-        return self.df[self.df.Epitope == epitope].PolymorphicResidues.values[0]
+        return self.lookup(epitope, 'PolymorphicResidues')
 
-    def min_hlavsep(self, epitopes:set, ignore_hla:set=set(), most_freq_hla:bool=False) -> dict:
+    def min_hlavsep(self,
+                    epitopes:set,
+                    ignore_hla:set=set(),
+                    most_freq_hla:bool=False,
+                    exact:bool=False,
+                    time_budget:float=1.0) -> dict:
         """ Returns the HLA vs epitope dictionary
             based on minimum number of HLA possible
             ignore_hla: ignores some hla
+            exact: search the minimum number of HLA instead of the greedy
+            approximation, within time_budget seconds. Frequent HLA are preferred on ties
             format { 'HLA' : {'epitopes'} }
         """
-        # Deep copy of epitopes set for later epitope removal
-        _epitopes = epitopes.copy()
         hlavsep_df = self.hlavsep(only_with_pdb=True, ignore_hla=ignore_hla)
         if most_freq_hla:
-            freq_hla = {
-                'A*02:01', 'A*01:01', 'A*03:01', #'A*24:02', 'A*11:01', 'A*68:01', 'A*31:01', 'A*32:01', 'A*26:01', 'A*29:02',
-                'B*07:02', 'B*08:01', 'B*15:01', #'B*44:02', 'B*40:01', 'B*35:01', 'B*51:01', 'B*44:03', 'B*57:01', 'B*18:01',
-                'DRB1*15:01', 'DRB1*03:01', 'DRB1*01:01', #'DRB1*07:01', 'DRB1*04:01', 'DRB1*13:01', 'DRB1*11:01', 'DRB1*13:02', 'DRB1*04:04', 'DRB1*14:54',
-                'DQB1*03:01', 'DQB1*06:02', 'DQB1*02:01', #'DQB1*05:01', 'DQB1*03:02', 'DQB1*02:02', 'DQB1*06:03', 'DQB1*06:04', 'DQB1*03:03', 'DQB1*05:03',
-            }
-            hlavsep_df = hlavsep_df[hlavsep_df['HLA'].apply(lambda x: x in freq_hla)]
-        hla_ep = defaultdict(set)
-        for _ in range(10):
-            intersect = hlavsep_df.Epitope.apply(
-                lambda x: len(x.intersection(_epitopes))
-            )
-            # find the indexes with maximum value
-            value_max = intersect.max()
-            if value_max:
-                ind_maxes = intersect == value_max
-                hlavsep_max_df = hlavsep_df[ind_maxes]
-                max_hla = hlavsep_max_df.HLA.values.tolist()[0]
-                ind_max = hlavsep_max_df.HLA == max_hla
-                set_of_ep = hlavsep_max_df[ind_max].Epitope.values[0].intersection(_epitopes)
-                hla_ep[max_hla] = set_of_ep
-                _epitopes.difference_update(set_of_ep)
+            hlavsep_df = hlavsep_df[hlavsep_df['HLA'].isin(FREQUENT_HLA)]
+        candidates = dict(zip(hlavsep_df.HLA, hlavsep_df.Epitope))
+        if exact:
+            priority = {hla: int(hla in FREQUENT_HLA) for hla in candidates}
+            hla_ep, optimal = exact_cover(candidates, epitopes, time_budget, priority)
+            if not optimal:
+                self.log.info(
+                    f'Time budget of {time_budget}s exceeded, the best cover found is used',
+                    extra={'messagePrefix': 'Epitope.min_hlavsep'}
+                )
+        else:
+            hla_ep = greedy_cover(candidates, epitopes)
+        _epitopes = uncovered_targets(hla_ep, epitopes)
         if _epitopes:
             self.log.info(
                 f'Epitopes :{_epitopes} could not be assigned',
                 extra={'messagePrefix': 'Epitope.min_hlavsep'}
             )
-        return dict(hla_ep)
+        return hla_ep
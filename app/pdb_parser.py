@@ -2,115 +2,175 @@
 This module contains functions that can read PDB files and return a
 JSON representation of the structural data."""
 
-import re
 import json
-import os
-from shutil import copy2
 
-import parmed as pmd
+import numpy as np
 
+from app.bond_perception import perceive_bonds
 
-def create_data(pdb_path):
+# Character positions [start, stop) of the ATOM/HETATM record fields
+# in the fixed-width PDB format
+PDB_COLUMNS = {
+    'record': [0, 6],
+    'serial': [6, 11],
+    'name': [12, 16],
+    'resname': [17, 20],
+    'chain': [21, 22],
+    'resid': [22, 26],
+    'x': [30, 38],
+    'y': [38, 46],
+    'z': [46, 54],
+    'occupancy': [54, 60],
+    'bfactor': [60, 66],
+    'element': [77, 79],
+}
+PDB_LINE_WIDTH = 80
+
+# Raw byte view on one fixed-width record, every field is a column slice
+_RAW_RECORD_DTYPE = np.dtype({
+    'names': list(PDB_COLUMNS),
+    'formats': [f'S{stop - start}' for start, stop in PDB_COLUMNS.values()],
+    'offsets': [start for start, _ in PDB_COLUMNS.values()],
+    'itemsize': PDB_LINE_WIDTH,
+})
+
+# Decoded atom records
+ATOM_DTYPE = np.dtype([
+    ('hetero', np.bool_),
+    ('serial', np.int32),
+    ('name', 'U4'),
+    ('resname', 'U3'),
+    ('chain', 'U1'),
+    ('resid', np.int32),
+    ('xyz', np.float32, (3,)),
+    ('occupancy', np.float32),
+    ('bfactor', np.float32),
+    ('element', 'U2'),
+])
+
+
+def _decode(column):
+    """ Strip and decode a fixed-width byte column into a unicode array """
+    return np.char.strip(column).astype('U')
+
+
+def _to_float(column):
+    """ Convert a fixed-width byte column into floats, blank fields become nan """
+    column = np.char.strip(column)
+    return np.where(column == b'', b'nan', column).astype(np.float32)
+
+
+def _read_lines(pdb_source) -> list:
+    """ Read the raw lines of a PDB source without touching any other file.
+    pdb_source can be a path, the file content as bytes or an open file object """
+    if isinstance(pdb_source, (bytes, bytearray, memoryview)):
+        return bytes(pdb_source).splitlines()
+    if hasattr(pdb_source, 'read'):
+        content = pdb_source.read()
+        return (content.encode() if isinstance(content, str) else content).splitlines()
+    with open(pdb_source, 'rb') as infile:
+        return infile.readlines()
+
+
+def read_atoms(pdb_source) -> np.ndarray:
     """
-    Parse the protein data bank (PDB) file to generate
-    input modelData
-    @param pdb_path
-    Name of the biomolecular structure file in PDB format
+    Read all the ATOM/HETATM records of a protein data bank (PDB) file
+    in bulk into a numpy structured array of dtype ATOM_DTYPE
+    @param pdb_source
+    Path of the biomolecular structure file in PDB format, its content
+    as bytes or an open file object
     """
+    # store only atom records, padded to the full record width
+    records = [
+        l.strip().ljust(PDB_LINE_WIDTH)[:PDB_LINE_WIDTH] for l in _read_lines(pdb_source)
+        if l.lstrip().startswith((b'ATOM', b'HETATM'))
+    ]
+
+    raw = np.frombuffer(b''.join(records), dtype=_RAW_RECORD_DTYPE)
+    atoms = np.empty(len(raw), dtype=ATOM_DTYPE)
+    atoms['hetero'] = raw['record'] == b'HETATM'
+    atoms['serial'] = raw['serial'].astype(np.int32)
+    atoms['name'] = _decode(raw['name'])
+    atoms['resname'] = _decode(raw['resname'])
+    atoms['chain'] = _decode(raw['chain'])
+    atoms['resid'] = raw['resid'].astype(np.int32)
+    atoms['xyz'] = np.stack([raw[axis].astype(np.float32) for axis in 'xyz'], axis=1)
+    atoms['occupancy'] = _to_float(raw['occupancy'])
+    atoms['bfactor'] = _to_float(raw['bfactor'])
+    atoms['element'] = _decode(raw['element'])
+    return atoms
 
-    # Create local copy of temp file
-    copy2(pdb_path, './tmp.pdb')
-
-    # Use parmed to read the bond information from temp file
-    top = pmd.load_file('tmp.pdb')
-
-    # Remove the created temp file
-    os.remove('tmp.pdb')
-
-    # Read PDB file to create atom/bond information
-    with open(pdb_path, 'r') as infile:
-        # store only non-empty lines
-        lines = [l.strip() for l in infile if l.strip()]
-
-    # Initialize all variables
-    var_nchains = []
-    serial = []
-    atm_name = []
-    res_name = []
-    chain = []
-    res_id = []
-    positions = []
-    occupancy = []
-    temp_factor = []
-    atom_type = []
-    ct = 0
-
-    datb = {
-        'atoms': [],
-        'bonds': []
-    }
 
-    # Variables that store the character positions of different
-    # parameters from the molecule PDB file
-    serialpos = [6, 11]
-    atm_namepos = [12, 16]
-    r_namepos = [17, 20]
-    chainpos = [21, 22]
-    r_idpos = [22, 26]
-    xpos = [30, 38]
-    ypos = [38, 46]
-    zpos = [46, 54]
-    occupos = [54, 60]
-    bfacpos = [60, 66]
-    atm_typepos = [77, 79]
-
-    for l in lines:
-        line = l.split()
-        if "ATOM" in line[0] or "HETATM" in line[0]:
-            serial.append(int(l[serialpos[0]:serialpos[1]]))
-            atm_name.append(l[atm_namepos[0]:atm_namepos[1]].strip())
-            val_r_name = l[r_namepos[0]:r_namepos[1]].strip()
-            res_name.append(val_r_name)
-            chain_val = l[chainpos[0]:chainpos[1]].strip()
-            chain.append(chain_val)
-            if chain_val not in var_nchains:
-                var_nchains.append(chain_val)
-            val_r_id = int(l[r_idpos[0]:r_idpos[1]])
-            res_id.append(val_r_id)
-            x = float(l[xpos[0]:xpos[1]])
-            y = float(l[ypos[0]:ypos[1]])
-            z = float(l[zpos[0]:zpos[1]])
-            positions.append([x, y, z])
-            occupancy.append(l[occupos[0]:occupos[1]].strip())
-            temp_factor.append(l[bfacpos[0]:bfacpos[1]].strip())
-            atom_type.append(l[atm_typepos[0]:atm_typepos[1]].strip())
-            ct += 1
-
-    # Create list of atoms
-    tmp_res = res_id[0]
-    resct = 1
-    for i in range(len(chain)):  # pylint: disable=consider-using-enumerate
-        if tmp_res != res_id[i]:
-            tmp_res = res_id[i]
-            resct += 1
-        datb['atoms'].append({
-            "name": atm_name[i],
-            "chain": chain[i],
-            "positions": positions[i],
-            "residue_index": resct,
-            "element": atom_type[i],
-            "residue_name": res_name[i] + str(res_id[i]),
+def build_atoms(atoms: np.ndarray) -> list:
+    """
+    Build the modelData list of atoms from the structured atom array
+    """
+    if len(atoms) == 0:
+        return []
+    resid = atoms['resid']
+    # residues are counted from 1 and increase on every change of residue number
+    residue_index = np.ones(len(atoms), dtype=np.int64)
+    residue_index[1:] += np.cumsum(resid[1:] != resid[:-1])
+    residue_name = np.char.add(atoms['resname'], resid.astype('U'))
+    # PDB coordinates carry 3 decimals, rounding restores the parsed values
+    positions = atoms['xyz'].astype(np.float64).round(3)
+
+    return [
+        {
+            "name": name,
+            "chain": chain,
+            "positions": position,
+            "residue_index": res_index,
+            "element": element,
+            "residue_name": res_name,
             "serial": i,
-        })
-
-    # Create list of bonds using the parmed module
-    for i in range(len(top.bonds)):
-        bondpair = top.bonds[i].__dict__
-        atom1 = re.findall(r"\[(\d+)\]", str(bondpair['atom1']))
-        atom2 = re.findall(r"\[(\d+)\]", str(bondpair['atom2']))
-        datb['bonds'].append({
-            'atom2_index': int(atom1[0]),
-            'atom1_index': int(atom2[0])
-        })
-
-    return json.dumps(datb)
\ No newline at end of file
+        }
+        for i, (name, chain, position, res_index, element, res_name) in enumerate(zip(
+            atoms['name'].tolist(),
+            atoms['chain'].tolist(),
+            positions.tolist(),
+            residue_index.tolist(),
+            atoms['element'].tolist(),
+            residue_name.tolist(),
+        ))
+    ]
+
+
+def build_bonds(bonds: np.ndarray) -> list:
+    """
+    Build the modelData list of bonds from the (n, 2) array of atom indices
+    """
+    return [
+        {'atom2_index': atom1, 'atom1_index': atom2}
+        for atom1, atom2 in bonds.tolist()
+    ]
+
+
+def parse_structure(pdb_source):
+    """
+    Parse a PDB source into its atom array and its (n, 2) bond array
+    """
+    atoms = read_atoms(pdb_source)
+    return atoms, perceive_bonds(atoms)
+
+
+def build_model(atoms: np.ndarray, bonds: np.ndarray) -> dict:
+    """
+    Build the modelData dictionary from the atom and bond arrays
+    """
+    return {
+        'atoms': build_atoms(atoms),
+        'bonds': build_bonds(bonds),
+    }
+
+
+def create_data(pdb_source):
+    """
+    Parse the protein data bank (PDB) file to generate
+    input modelData. Nothing is written to disk, so the function
+    can be called from many threads and processes at once.
+    @param pdb_source
+    Path of the biomolecular structure file in PDB format, its content
+    as bytes or an open file object
+    """
+    return json.dumps(build_model(*parse_structure(pdb_source)))
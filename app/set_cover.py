@@ -0,0 +1,134 @@
+""" Set cover engine used to find the minimum number of HLA that accommodate a set of epitopes.
+Every candidate (HLA) is encoded as a bitmask row over the target elements (epitopes), so
+coverage gains of all candidates are computed at once with vectorized popcounts.
+The exact solver searches the minimum cover with branch and bound on python int bitmasks """
+import time
+from typing import Dict, Hashable, Set, Tuple
+
+import numpy as np
+
+# number of set bits of every byte value
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
+
+
+def encode(candidates:Dict[Hashable, set], targets:set) -> Tuple[list, list, np.ndarray]:
+    """ Encodes the candidate sets as packed bitmask rows over the sorted target elements.
+    Returns the candidate names, the target elements and the (candidates, bytes) uint8 matrix """
+    names = list(candidates)
+    elements = sorted(targets)
+    position = {element: i for i, element in enumerate(elements)}
+    matrix = np.zeros((len(names), len(elements)), dtype=bool)
+    for row, name in enumerate(names):
+        columns = [position[element] for element in candidates[name] if element in position]
+        matrix[row, columns] = True
+    return names, elements, np.packbits(matrix, axis=1)
+
+
+def popcount(packed:np.ndarray) -> np.ndarray:
+    """ Number of set bits of every packed row """
+    return POPCOUNT[packed].sum(axis=-1)
+
+
+def decode(row:np.ndarray, elements:list) -> Set:
+    """ Translates a packed bitmask row back into the set of elements """
+    bits = np.unpackbits(row)[:len(elements)]
+    return {elements[i] for i in np.flatnonzero(bits)}
+
+
+def greedy_cover(candidates:Dict[Hashable, set], targets:set) -> Dict[Hashable, set]:
+    """ Greedy set cover: repeatedly takes the candidate that covers most of the uncovered
+    targets (the first one in candidate order on a tie) until all targets are covered or
+    no candidate adds anything. Returns { candidate: {covered targets} } """
+    names, elements, packed = encode(candidates, targets)
+    if not names or not elements:
+        return {}
+    uncovered = np.packbits(np.ones(len(elements), dtype=bool))
+    cover = {}
+    while True:
+        gains = popcount(packed & uncovered)
+        best = int(gains.argmax())
+        if gains[best] == 0:
+            break
+        cover[names[best]] = decode(packed[best] & uncovered, elements)
+        uncovered &= ~packed[best]
+    return cover
+
+
+def uncovered_targets(cover:Dict[Hashable, set], targets:set) -> set:
+    """ The targets that none of the chosen candidates cover """
+    covered = set()
+    for elements in cover.values():
+        covered |= elements
+    return targets - covered
+
+
+def _bits(mask:int):
+    """ Positions of the set bits of a python int """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def _popcount(mask:int) -> int:
+    return bin(mask).count('1')
+
+
+def exact_cover(candidates:Dict[Hashable, set],
+                targets:set,
+                time_budget:float=1.0,
+                priority:Dict[Hashable, float]=None) -> Tuple[Dict[Hashable, set], bool]:
+    """ Minimum set cover by branch and bound. Candidates whose targets are a subset of another
+    candidate's are pruned (dominance), the greedy cover is the first upper bound and the search
+    stops after time_budget seconds with the best cover found so far.
+    priority: higher values are preferred on ties, e.g. HLA expression or frequency
+    Returns ({ candidate: {covered targets} }, True if the cover is proven minimal) """
+    priority = priority or {}
+    position = {element: i for i, element in enumerate(sorted(targets))}
+    masks = {}
+    for name in sorted(candidates, key=lambda name: -priority.get(name, 0)):
+        mask = 0
+        for element in candidates[name]:
+            if element in position:
+                mask |= 1 << position[element]
+        if mask:
+            masks[name] = mask
+
+    # dominance pruning, on equal sets the preferred candidate is kept
+    kept = []
+    for name, mask in masks.items():
+        if any(mask & ~masks[other] == 0 for other in kept):
+            continue
+        kept = [other for other in kept if masks[other] & ~mask] + [name]
+    kept.sort(key=lambda name: -priority.get(name, 0))
+    covering = {bit: [name for name in kept if masks[name] >> bit & 1] for bit in range(len(position))}
+
+    best = list(greedy_cover({name: candidates[name] for name in kept}, targets))
+    deadline = time.monotonic() + time_budget
+    timed_out = False
+
+    def search(uncovered:int, chosen:list):
+        nonlocal best, timed_out
+        if timed_out or time.monotonic() > deadline:
+            timed_out = True
+            return
+        if not uncovered:
+            if len(chosen) < len(best):
+                best = list(chosen)
+            return
+        max_gain = max(_popcount(masks[name] & uncovered) for name in kept)
+        lower_bound = -(-_popcount(uncovered) // max_gain)
+        if len(chosen) + lower_bound >= len(best):
+            return
+        # branch on the uncovered target with the fewest candidates
+        bit = min(_bits(uncovered), key=lambda bit: len(covering[bit]))
+        for name in sorted(covering[bit], key=lambda name: -_popcount(masks[name] & uncovered)):
+            chosen.append(name)
+            search(uncovered & ~masks[name], chosen)
+            chosen.pop()
+
+    coverable = 0
+    for name in kept:
+        coverable |= masks[name]
+    search(coverable, [])
+    return greedy_cover({name: candidates[name] for name in best}, targets), not timed_out
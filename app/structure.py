@@ -0,0 +1,116 @@
+"""Structure
+A .pdb file parsed once into atom and bond arrays. The same Structure feeds
+the model serialisation (pdb_parser) and the style generation (styles_parser),
+so a file is read and decoded only once per request. Objects derived from the
+arrays (the modelData, the residue index, the base styles) are built once, kept with the
+structure and counted in its nbytes."""
+
+import sys
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from app.pdb_parser import parse_structure, build_model
+
+
+def sizeof(obj) -> int:
+    """ Approximate memory of an object and of the containers and values it holds,
+    objects referenced more than once are counted once """
+    seen, size, stack = set(), 0, [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+    return size
+
+
+class Structure:
+    """ Parsed atoms (pdb_parser.ATOM_DTYPE) and (n, 2) bonds of one .pdb file """
+
+    def __init__(self, atoms:np.ndarray, bonds:np.ndarray, name:str=''):
+        self.atoms = atoms
+        self.bonds = bonds
+        self.name = name
+        # called with (structure, added bytes) when a derived object is built,
+        # set by the StructureCache that holds the structure
+        self.on_grow = None
+        self._derived = {}
+        self._derived_nbytes = 0
+        # reentrant, a derived object may be built from another one
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_pdb(cls, pdb_source, name:str=None):
+        """ Parse a .pdb path, its content as bytes or an open file object """
+        atoms, bonds = parse_structure(pdb_source)
+        if name is None:
+            name = pdb_source if isinstance(pdb_source, str) else ''
+        return cls(atoms, bonds, name)
+
+    def __repr__(self):
+        return f""" Structure(name={self.name}, atoms={len(self.atoms)}, bonds={len(self.bonds)}) """
+
+    def __len__(self):
+        return len(self.atoms)
+
+    @property
+    def nbytes(self) -> int:
+        """ Memory of the arrays and of the derived objects built so far """
+        return self.atoms.nbytes + self.bonds.nbytes + self._derived_nbytes
+
+    def derived(self, key, build:Callable[[], object]):
+        """ The object built by build() for key, built once per structure and shared
+        by all requests, it must not be changed. Its size is added to nbytes """
+        with self._lock:
+            if key in self._derived:
+                return self._derived[key]
+            value = self._derived[key] = build()
+            added = sizeof(value)
+            self._derived_nbytes += added
+        if self.on_grow is not None:
+            self.on_grow(self, added)
+        return value
+
+    def to_model(self) -> dict:
+        """ The modelData dictionary of Molecule3dViewer """
+        return build_model(self.atoms, self.bonds)
+
+    @property
+    def model(self) -> dict:
+        """ The modelData built once and shared by all requests, it must not be changed """
+        return self.derived('model', self.to_model)
+
+    @property
+    def residue_ranges(self) -> Dict[Tuple[str, int], List[Tuple[int, int]]]:
+        """ Index from (chain, residue number) to the [start, stop) atom index
+        ranges of that residue, atoms of a residue are contiguous in a .pdb file """
+        return self.derived('residue_ranges', self._residue_ranges)
+
+    def _residue_ranges(self) -> Dict[Tuple[str, int], List[Tuple[int, int]]]:
+        atoms = self.atoms
+        change = np.zeros(len(atoms), dtype=bool)
+        change[:1] = True
+        change[1:] = (atoms['chain'][1:] != atoms['chain'][:-1]) | (atoms['resid'][1:] != atoms['resid'][:-1])
+        starts = np.flatnonzero(change)
+        stops = np.r_[starts[1:], len(atoms)]
+        ranges = defaultdict(list)
+        for chain, resid, start, stop in zip(
+                atoms['chain'][starts].tolist(), atoms['resid'][starts].tolist(), starts.tolist(), stops.tolist()):
+            ranges[(chain, resid)].append((start, stop))
+        return dict(ranges)
+
+    def residue_atoms(self, chain:str, resid:int) -> List[int]:
+        """ Atom indices of one residue, empty if the residue is not in the structure """
+        return [
+            index for start, stop in self.residue_ranges.get((chain, resid), [])
+            for index in range(start, stop)
+        ]
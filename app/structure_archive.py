@@ -0,0 +1,127 @@
+"""Structure archive
+This module packs the parsed structures of the whole HLA inventory
+(data/HLAMolecule/<locus>/*.pdb) into one archive directory:
+
+    atoms.npy   atoms of all structures (ATOM_DTYPE, coordinates included)
+    bonds.npy   int32 (n_bonds, 2) bonds, indices local to each structure
+    index.json  offset table of every .pdb file and HLA -> .pdb file map
+
+At runtime the arrays are opened memory-mapped, so worker processes share
+the pages through the OS cache and a lookup returns read-only views of the
+atom and bond rows of the file, nothing is copied.
+
+Build the archive with
+    python -m app.structure_archive [base_dir] [archive_dir]
+"""
+
+import os
+import sys
+import json
+import shutil
+from typing import Tuple
+
+import numpy as np
+
+from app.pdb_parser import ATOM_DTYPE, parse_structure
+from app.common.utilities import get_hla_from_filename
+
+BASE_DIR = './data/HLAMolecule'
+ARCHIVE_DIR = './data/structure_archive'
+
+def build_archive(base_dir:str=BASE_DIR, archive_dir:str=ARCHIVE_DIR) -> dict:
+    """
+    Parse every .pdb file of the inventory once and write the packed archive.
+    Returns the offset table that is written to index.json
+    """
+    base_dir, archive_dir = os.path.expanduser(base_dir), os.path.expanduser(archive_dir)
+    structure_atoms, bonds = [], []
+    index = {'base_dir': base_dir, 'files': {}, 'hlas': {}}
+    n_atoms = n_bonds = 0
+    with os.scandir(base_dir) as entries:
+        loci = sorted(entry.path for entry in entries if entry.is_dir())
+    for locus_dir in loci:
+        for file in sorted(os.listdir(locus_dir)):
+            if not file.endswith('.pdb'):
+                continue
+            pdb_path = os.path.join(locus_dir, file)
+            atoms, structure_bonds = parse_structure(pdb_path)
+            stat = os.stat(pdb_path)
+            relpath = os.path.relpath(pdb_path, base_dir)
+            index['files'][relpath] = {
+                'atoms': [n_atoms, n_atoms + len(atoms)],
+                'bonds': [n_bonds, n_bonds + len(structure_bonds)],
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+            }
+            for hla in get_hla_from_filename(file):
+                index['hlas'].setdefault(hla, relpath)
+            structure_atoms.append(atoms.astype(ATOM_DTYPE))
+            bonds.append(structure_bonds.astype(np.int32))
+            n_atoms += len(atoms)
+            n_bonds += len(structure_bonds)
+
+    # write next to the old archive and swap it in at the end
+    tmp_dir = f'{archive_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, 'atoms.npy'), np.concatenate(structure_atoms) if structure_atoms else np.empty(0, ATOM_DTYPE))
+    np.save(os.path.join(tmp_dir, 'bonds.npy'), np.concatenate(bonds) if bonds else np.empty((0, 2), np.int32))
+    with open(os.path.join(tmp_dir, 'index.json'), 'w') as outfile:
+        json.dump(index, outfile)
+    shutil.rmtree(archive_dir, ignore_errors=True)
+    os.rename(tmp_dir, archive_dir)
+    return index
+
+
+class StructureArchive:
+    """ Read-only, memory-mapped view on an archive written by build_archive """
+
+    def __init__(self, archive_dir:str=ARCHIVE_DIR):
+        self.archive_dir = os.path.expanduser(archive_dir)
+        with open(os.path.join(self.archive_dir, 'index.json')) as infile:
+            index = json.load(infile)
+        self.base_dir = os.path.abspath(index['base_dir'])
+        self.files = index['files']
+        self.hlas = index['hlas']
+        self.atoms = np.load(os.path.join(self.archive_dir, 'atoms.npy'), mmap_mode='r')
+        self.bonds = np.load(os.path.join(self.archive_dir, 'bonds.npy'), mmap_mode='r')
+
+    def __repr__(self):
+        return f""" StructureArchive(files={len(self.files)}, atoms={len(self.atoms)}, bonds={len(self.bonds)}) """
+
+    def __contains__(self, relpath:str):
+        return relpath in self.files
+
+    def relpath(self, pdb_path:str) -> str:
+        """ Path of a .pdb file relative to the archived inventory """
+        return os.path.relpath(os.path.abspath(pdb_path), self.base_dir)
+
+    def is_current(self, pdb_path:str) -> bool:
+        """ True if the .pdb file is archived and unchanged since the archive was built """
+        entry = self.files.get(self.relpath(pdb_path))
+        if entry is None:
+            return False
+        stat = os.stat(pdb_path)
+        return (entry['size'], entry['mtime_ns']) == (stat.st_size, stat.st_mtime_ns)
+
+    def get(self, relpath:str) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns read-only views of the atom (ATOM_DTYPE) and bond arrays of one archived .pdb file """
+        entry = self.files[relpath]
+        (atom_start, atom_stop), (bond_start, bond_stop) = entry['atoms'], entry['bonds']
+        return self.atoms[atom_start:atom_stop], self.bonds[bond_start:bond_stop]
+
+    def get_hla(self, hla:str) -> Tuple[np.ndarray, np.ndarray]:
+        """ Returns the atom and bond arrays of the .pdb file of an HLA """
+        return self.get(self.hlas[hla])
+
+
+def open_archive(archive_dir:str=ARCHIVE_DIR):
+    """ Opens the archive if it has been built, otherwise returns None """
+    if not os.path.exists(os.path.join(os.path.expanduser(archive_dir), 'index.json')):
+        return None
+    return StructureArchive(archive_dir)
+
+
+if __name__ == '__main__':
+    built = build_archive(*sys.argv[1:3])
+    print(f"Archived {len(built['files'])} .pdb files for {len(built['hlas'])} HLA's")
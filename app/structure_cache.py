@@ -0,0 +1,149 @@
+"""Structure cache
+This module keeps parsed HLA structures (see app.structure) so every
+.pdb file is parsed once. Parsed structures are stored as .npz files under
+a cache directory and an in-process LRU layer with a memory ceiling sits in
+front of it. Entries are keyed on the file path, size and modification time
+(or content hash), so a changed .pdb file is parsed again automatically.
+When a prebuilt structure archive (see app.structure_archive) holds an
+unchanged copy of the file, the arrays are sliced from the archive instead."""
+
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+import numpy as np
+
+from app.structure import Structure
+from app.structure_archive import open_archive
+
+CACHE_DIR = './data/cache/structures'
+MAX_CACHE_BYTES = 256 * 2**20
+
+
+class StructureCache:
+    """ Layered (memory LRU -> archive -> .npz on disk) cache of parsed structures """
+
+    def __init__(self,
+                cache_dir:str=CACHE_DIR,
+                max_bytes:int=MAX_CACHE_BYTES,
+                content_hash:bool=False,
+                archive=None):
+        """
+        cache_dir: directory of the .npz files, None keeps the cache in memory only
+        max_bytes: memory ceiling of the in-process LRU layer
+        content_hash: key on the file content instead of its modification time
+        archive: optional StructureArchive that is looked up before the .npz files
+        """
+        self.archive = archive
+        self.cache_dir = os.path.expanduser(cache_dir) if cache_dir else None
+        self.max_bytes = max_bytes
+        self.content_hash = content_hash
+        self.nbytes = 0
+        # bytes counted for every entry, derived objects are added when they are built
+        self._entry_bytes = {}
+        self.stats = {'memory': 0, 'archive': 0, 'disk': 0, 'parsed': 0}
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f""" StructureCache(entries={len(self._lru)}, nbytes={self.nbytes}, stats={self.stats}) """
+
+    def _key(self, pdb_path:str) -> Tuple[str, str]:
+        """ Returns the digest of the file path and the digest of its current version """
+        path = os.path.abspath(pdb_path)
+        stat = os.stat(path)
+        if self.content_hash:
+            with open(path, 'rb') as infile:
+                version = hashlib.sha1(infile.read()).hexdigest()
+        else:
+            version = f'{stat.st_mtime_ns}'
+        path_digest = hashlib.sha1(path.encode()).hexdigest()[:16]
+        version_digest = hashlib.sha1(f'{stat.st_size}|{version}'.encode()).hexdigest()[:16]
+        return path_digest, version_digest
+
+    def _load(self, npz_path:str):
+        with np.load(npz_path, allow_pickle=False) as npz:
+            return npz['atoms'], npz['bonds']
+
+    def _store(self, path_digest:str, npz_path:str, atoms:np.ndarray, bonds:np.ndarray):
+        """ Write the .npz atomically and remove the stale versions of the same file """
+        os.makedirs(self.cache_dir, exist_ok=True)
+        handle, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.npz.tmp')
+        with os.fdopen(handle, 'wb') as outfile:
+            np.savez(outfile, atoms=atoms, bonds=bonds)
+        os.replace(tmp_path, npz_path)
+        for file in os.listdir(self.cache_dir):
+            if file.startswith(f'{path_digest}-') and file != os.path.basename(npz_path):
+                try:
+                    os.remove(os.path.join(self.cache_dir, file))
+                except FileNotFoundError:
+                    pass
+
+    def _evict(self):
+        """ Evict the least recently used entries above max_bytes, called with the lock held """
+        while self.nbytes > self.max_bytes and len(self._lru) > 1:
+            old_key, _ = self._lru.popitem(last=False)
+            self.nbytes -= self._entry_bytes.pop(old_key)
+
+    def _remember(self, key, structure:Structure) -> Structure:
+        """ Put an entry in the LRU layer and evict the oldest ones above max_bytes """
+        with self._lock:
+            if key in self._lru:
+                return self._lru[key]
+            self._lru[key] = structure
+            self._entry_bytes[key] = structure.nbytes
+            self.nbytes += structure.nbytes
+            structure.on_grow = lambda structure, added: self._grow(key, structure, added)
+            self._evict()
+        return structure
+
+    def _grow(self, key, structure:Structure, added:int):
+        """ Count an object derived from a cached structure, e.g. its modelData """
+        with self._lock:
+            if self._lru.get(key) is not structure:
+                return
+            self._lru.move_to_end(key)
+            self._entry_bytes[key] += added
+            self.nbytes += added
+            self._evict()
+
+    def get(self, pdb_path:str) -> Structure:
+        """ Returns the read-only Structure of a .pdb file """
+        key = self._key(pdb_path)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                self.stats['memory'] += 1
+                return self._lru[key]
+
+        npz_path = os.path.join(self.cache_dir, '-'.join(key) + '.npz') if self.cache_dir else None
+        if self.archive is not None and self.archive.is_current(pdb_path):
+            atoms, bonds = self.archive.get(self.archive.relpath(pdb_path))
+            self.stats['archive'] += 1
+        elif npz_path and os.path.exists(npz_path):
+            atoms, bonds = self._load(npz_path)
+            self.stats['disk'] += 1
+        else:
+            structure = Structure.from_pdb(pdb_path)
+            atoms, bonds = structure.atoms, structure.bonds
+            self.stats['parsed'] += 1
+            if npz_path:
+                self._store(key[0], npz_path, atoms, bonds)
+
+        atoms.flags.writeable = False
+        bonds.flags.writeable = False
+        return self._remember(key, Structure(atoms, bonds, pdb_path))
+
+    def clear(self):
+        """ Empty the in-process layer, the .npz files are kept """
+        with self._lock:
+            self._lru.clear()
+            self._entry_bytes.clear()
+            self.nbytes = 0
+
+
+# Process wide cache used by the visualisation
+STRUCTURE_CACHE = StructureCache(archive=open_archive())
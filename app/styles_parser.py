@@ -6,6 +6,8 @@ Modified October 2020 by Danial Senejohnny, d.senejohnny@gmail.com """
 
 import json
 import logging
+import numpy as np
+from app.structure import Structure
 # from app.analysis_utils import setup_logger
 # logger = setup_logger('aminoacid', 'data/aminoacid.log')
 
@@ -129,8 +131,111 @@ def fill_in_defaults(input_dict, default_dict):
     return input_dict
 
 
-def create_style(
-        pdb_path:str,
+# desa color
+DESA_COLOR_DICT = {
+    'desa': '#FFFF00', # Yellow
+    'desa_rAb': '#FFA500', # Orange
+    'desa_mAb': '#FF0000', # Red
+}
+# the overlays are applied in this order, later ones recolor the former
+DESA_TYPES = ['desa', 'desa_rAb', 'desa_mAb']
+
+
+def lookup_colors(values, color_dict, default):
+    """Translate an array of categorical values into colors. The dictionary is
+    only consulted once per distinct value, the atoms are mapped through codes.
+    """
+    categories, codes = np.unique(values, return_inverse=True)
+    palette = np.array(
+        [color_dict.get(category, default) for category in categories.tolist()] + [default],
+        dtype=object,
+    )
+    return palette[codes.reshape(-1)] if len(values) else palette[:0]
+
+
+def base_colors(
+        structure,
+        mol_color:str,
+        residue_type_colors:dict,
+        atom_colors:dict,
+        chain_colors:dict,
+        residue_colors:dict,
+):
+    """Color of every atom of the structure in one of the color schemes
+    (options: residue_type, atom, residue, chain). Hetero atoms are always
+    colored by atom. Atoms without color (unknown scheme) are None.
+    """
+    atoms = structure.atoms
+    elements = np.array([element[:1] for element in atoms['element'].tolist()], dtype='U1')
+    res_names = np.char.upper(atoms['resname'])
+    if mol_color == 'chain':
+        colors = lookup_colors(atoms['chain'], chain_colors, '#BEA06E')
+    elif mol_color == 'residue':
+        colors = lookup_colors(res_names, residue_colors, '#BEA06E')
+    elif mol_color == 'residue_type':
+        type_colors = {res: residue_type_colors[res_type] for res, res_type in RESIDUE_TYPES.items()}
+        colors = lookup_colors(res_names, type_colors, '#BEA06E')
+    elif mol_color == 'atom':
+        colors = lookup_colors(elements, atom_colors, '#330000')
+    else:
+        colors = np.full(len(atoms), None, dtype=object)
+    hetero = atoms['hetero']
+    colors[hetero] = lookup_colors(elements[hetero], atom_colors, '#330000')
+    return colors
+
+
+def epitope_indices(structure, desa_info:dict):
+    """Atom indices of every desa type in desa_info, taken from the residue
+    index of the structure. Only the atoms of the polymorphic chain are colored.
+    """
+    atoms = structure.atoms
+    chain = desa_info['chain']
+    indices = {}
+    for desa_type in DESA_TYPES:
+        residues = desa_info[desa_type].keys() if desa_type == 'desa' else desa_info[desa_type]
+        type_indices = []
+        for res_indx in residues:
+            res_atoms = [index for index in structure.residue_atoms(chain, int(res_indx))
+                         if not atoms['hetero'][index]]
+            if desa_type == 'desa' and res_atoms:
+                found_res_name = Aminoacid_conversion.get(atoms['resname'][res_atoms[0]])
+                exp_res_name = desa_info['desa'][res_indx]
+                if found_res_name != exp_res_name:
+                    logger.info(f"""In the .pdb file {structure.name}, chain:{chain}, 
+                        Expected {res_indx}{exp_res_name}, found: {res_indx}{found_res_name}""")
+            type_indices.extend(res_atoms)
+        indices[desa_type] = np.array(type_indices, dtype=np.int64)
+    return indices
+
+
+def styles_to_dict(colors, visualization_types) -> dict:
+    """Materialise the color and visualization type arrays into the
+    {atom index: {'color', 'visualization_type'}} mapping of Molecule3dViewer
+    """
+    return {
+        index: {'color': color, 'visualization_type': visualization_type}
+        for index, (color, visualization_type) in enumerate(zip(colors.tolist(), visualization_types.tolist()))
+        if color is not None
+    }
+
+
+def base_style(structure, style:str, mol_color:str) -> dict:
+    """Style mapping of the structure in the default colors without any epitope.
+    It only depends on the structure, style and mol_color, so it is computed once
+    and kept with the structure, where it is counted in the structure cache ceiling.
+    The returned mapping is shared and must not be changed.
+    """
+    def build():
+        colors = base_colors(
+            structure, mol_color, RESIDUE_TYPE_COLOR_DICT, ATOM_COLOR_DICT, CHAIN_COLOR_DICT, RESIDUE_COLOR_DICT
+        )
+        visualization_types = np.where(structure.atoms['hetero'], 'stick', style)
+        return styles_to_dict(colors, visualization_types)
+    return structure.derived(('base_style', style, mol_color), build)
+
+
+def build_style(
+        structure,
         style:str,
         mol_color:str,
         desa_info:dict,
@@ -140,10 +245,10 @@ def create_style(
         residue_colors=None, 
 ):
     """Function to create the different styles (stick, cartoon, sphere)
-    using the protein data bank (PDB) file as input. This function outputs
-    the styles as a JSON file
-    @param pdb_path
-    Name of the biomolecular structure file in PDB format
+    using the parsed protein data bank (PDB) structure as input. This function
+    outputs the styles as the dictionary consumed by Molecule3dViewer
+    @param structure
+    Parsed Structure of the biomolecule or the name of its file in PDB format
     @param style
     Type of representation of the biomolecule (options: stick, cartoon, sphere)
     @param mol_color
@@ -156,10 +261,17 @@ def create_style(
     in JSON format
     """
 
-    # Read input file
-    with open(pdb_path, 'r') as infile:
-        # store only non-empty lines
-        lines = [l.strip() for l in infile if l.strip()]
+    if not isinstance(structure, Structure):
+        structure = Structure.from_pdb(structure)
+
+    if not any([residue_type_colors, atom_colors, chain_colors, residue_colors]):
+        # Default colors: copy the cached base style and only apply the epitope overlay
+        data = dict(base_style(structure, style, mol_color))
+        for desa_type, indices in epitope_indices(structure, desa_info).items():
+            overlay = {'color': DESA_COLOR_DICT[desa_type], 'visualization_type': style}
+            for index in indices.tolist():
+                data[index] = overlay
+        return data
 
     # Merge dictionaries if necessary
     residue_type_colors = fill_in_defaults(residue_type_colors,
@@ -171,119 +283,18 @@ def create_style(
     residue_colors = fill_in_defaults(residue_colors,
                                       RESIDUE_COLOR_DICT)
 
-    # Initialize variables
-    chains = []
-    atm_types = []
-    res_names = []
-    res_indxs = []
-
-    data = {}
-    # desa color
-    desa_color = {
-        'desa': '#FFFF00', # Yellow
-        'desa_rAb': '#FFA500', # Orange
-        'desa_mAb': '#FF0000', # Red
-    }
+    colors = base_colors(structure, mol_color, residue_type_colors, atom_colors, chain_colors, residue_colors)
+    visualization_types = np.where(structure.atoms['hetero'], 'stick', style)
 
-    # Variables that store the character positions of different
-    # parameters from the molecule PDB file
-    pos = {
-        'res_name': [17, 20],
-        'chain': [21, 22],
-        'res_indx': [23, 26],
-        'atm_type': [77, 78],
-    }
+    # Recolor the epitope residues, desa_rAb and desa_mAb recolor the epitopes of the former step
+    for desa_type, indices in epitope_indices(structure, desa_info).items():
+        colors[indices] = DESA_COLOR_DICT[desa_type]
 
-    for l in lines:
-        line = l.split()
-
-        # ignore irrelevant lines
-        if "ATOM" not in line[0] and "HETATM" not in line[0]:
-            continue
-
-        chain = l[
-            pos['chain'][0]:pos['chain'][1]
-        ]
-        atm_type = l[
-            pos['atm_type'][0]:pos['atm_type'][1]
-        ]
-        res_name = l[
-            pos['res_name'][0]:pos['res_name'][1]
-        ].strip()
-        res_indx = l[
-            pos['res_indx'][0]:pos['res_indx'][1]
-        ].strip()
-
-        chains.append(chain)
-        atm_types.append(atm_type)
-        res_names.append(res_name)
-        res_indxs.append(res_indx)
-        index = len(chains) - 1
-
-        if line[0] == "ATOM":
-            if mol_color == 'chain':
-                data[index] = {
-                    'color': chain_colors[
-                        chain
-                    ] if chain in chain_colors else '#BEA06E',
-                    'visualization_type': style
-                }
-            elif mol_color == 'residue':
-                data[index] = {
-                    'color': residue_colors[
-                        res_name.upper()
-                    ] if res_name.upper() in residue_colors else '#BEA06E',
-                    'visualization_type': style
-                }
-            elif mol_color == 'residue_type':
-                data[index] = {
-                    'color': residue_type_colors[
-                        RESIDUE_TYPES[res_name.upper()]
-                    ] if res_name.upper() in RESIDUE_TYPES else '#BEA06E',
-                    'visualization_type': style
-                }
-            elif mol_color == 'atom':
-                data[index] = {
-                    'color': atom_colors[
-                        atm_type
-                    ] if atm_type in atom_colors else '#330000',
-                    'visualization_type': style
-                }
-            if chain == desa_info['chain']:
-                if res_indx in desa_info['desa'].keys():
-                    # desa_set = desa_info['desa'].keys()
-                    # logger.info(f' {res_indx}, {desa_set}')    
-                    data[index] = {
-                            "color": desa_color['desa'],
-                            "visualization_type": style
-                        }
-                    try:
-                        found_res_name, exp_res_name = Aminoacid_conversion.get(res_name), desa_info['desa'][res_indx]
-                        # print(f'Expected {res_indx}{exp_res_name}, found: {res_indx}{found_res_name}')
-                        assert found_res_name == exp_res_name
-                    except AssertionError:
-                        logger.info(f"""In the .pdb file {pdb_path}, chain:{chain}, 
-                            Expected {res_indx}{exp_res_name}, found: {res_indx}{found_res_name}""")
-                if int(res_indx) in desa_info['desa_rAb']: # we put if to recolor the epitopes in the former step
-                    data[index] = {
-                            "color": desa_color['desa_rAb'],
-                            "visualization_type": style
-                        }
-                if int(res_indx) in desa_info['desa_mAb']: # we put if to recolor the epitopes in the former step
-                    data[index] = {
-                            "color": desa_color['desa_mAb'],
-                            "visualization_type": style
-                        }
-        else:
-            if atm_type in atom_colors:
-                data[index] = {
-                    "color": atom_colors[atm_type],
-                    "visualization_type": "stick"
-                }
-            else:
-                data[index] = {
-                    "color": "#330000",
-                    "visualization_type": "stick"
-                }
-
-    return json.dumps(data)
+    return styles_to_dict(colors, visualization_types)
+
+
+def create_style(structure, style:str, mol_color:str, desa_info:dict, **colors):
+    """Function to create the different styles (stick, cartoon, sphere), see
+    build_style. This function outputs the styles as a JSON file
+    """
+    return json.dumps(build_style(structure, style, mol_color, desa_info, **colors))
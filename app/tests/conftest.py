@@ -0,0 +1,21 @@
+""" fixtures shared by the test scripts of app """
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def desa_path(tmp_path):
+    """ Pickle of a small DESA frame with every column the DESA table, its filters
+    and the exports use """
+    path = tmp_path / 'desa.pickle'
+    pd.DataFrame({
+        'TransplantID': [1, 2, 3, 4, 5],
+        '#DESA': [3, 0, 1, 4, 2],
+        'Failure': [1, 0, 1, 0, 1],
+        'Survival[Y]': [0.1234, 12.0, 5.0, 0.0, 0.2],
+        'Donor_HLA': [{'A*01:01', 'B*07:02'}, {'A*02:01'}, {'A*01:01'}, {'DRB1*15:01'}, {'A*01:01'}],
+        'Donor_HLA_Class': ['I', 'I', 'I', 'II', 'I'],
+        'Donor_Type': ['Living', 'Deceased', 'Deceased', 'Deceased', 'Deceased'],
+        'Graft_Func': ['PRI', 'PRI', 'NEV', 'PRI', None],
+    }).to_pickle(path)
+    return str(path)
@@ -0,0 +1,53 @@
+""" test scripts for app.bond_perception """
+import os
+import json
+import numpy as np
+import pytest
+from app.pdb_parser import ATOM_DTYPE, create_data, read_atoms
+from app.bond_perception import perceive_bonds
+
+PDB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'two_chains.pdb')
+HLA_MOLECULE_DIR = './data/HLAMolecule'
+
+
+def _pdb_files():
+    """ The fixture, which is always there, and the HLA molecules when the data is present """
+    if not os.path.isdir(HLA_MOLECULE_DIR):
+        return [PDB_PATH]
+    return [PDB_PATH] + sorted(
+        os.path.join(root, file) for root, _, files in os.walk(HLA_MOLECULE_DIR)
+        for file in files if file.endswith('.pdb')
+    )
+
+
+def test_perceive_bonds():
+    atoms = read_atoms(PDB_PATH)
+    bonds = perceive_bonds(atoms)
+    # 31 template bonds, 5 peptide bonds and one disulfide bond
+    assert len(bonds) == 31 + 5 + 1
+    assert (bonds[:, 0] < bonds[:, 1]).all()
+    names = {(atoms[i]['chain'], atoms[i]['name'], atoms[j]['chain'], atoms[j]['name']) for i, j in bonds}
+    assert ('A', 'SG', 'B', 'SG') in names
+    assert not np.isin(np.flatnonzero(atoms['hetero']), bonds).any()
+
+
+def test_perceive_bonds_hydrogens():
+    atoms = np.zeros(3, dtype=ATOM_DTYPE)
+    atoms['name'] = ['O', 'H1', 'H2']
+    atoms['resname'] = 'HOH'
+    atoms['element'] = ['O', 'H', '']
+    atoms['xyz'] = [[0.0, 0.0, 0.0], [0.957, 0.0, 0.0], [-0.24, 0.927, 0.0]]
+    assert perceive_bonds(atoms).tolist() == [[0, 1], [0, 2]]
+
+
+def test_perceive_bonds_empty():
+    assert perceive_bonds(np.zeros(0, dtype=ATOM_DTYPE)).shape == (0, 2)
+    assert json.loads(create_data(b'HEADER x\n'))['bonds'] == []
+
+
+@pytest.mark.parametrize('pdb_path', _pdb_files())
+def test_perceive_bonds_matches_parmed(pdb_path):
+    pmd = pytest.importorskip('parmed')
+    expected = {tuple(sorted((bond.atom1.idx, bond.atom2.idx))) for bond in pmd.load_file(pdb_path).bonds}
+    bonds = perceive_bonds(read_atoms(pdb_path))
+    assert set(map(tuple, bonds.tolist())) == expected
@@ -0,0 +1,53 @@
+""" test scripts for app.desa.py """
+import pytest
+from app.desa import DESA
+
+
+@pytest.mark.parametrize('apply_filters, expected_output',
+[
+    (lambda desa: desa.donor_type('Deceased'), [2, 3, 4, 5]),
+    (lambda desa: desa.graft_function(), [1, 2, 5]),
+    (lambda desa: desa.tx_with_hla('A*01:01'), [1, 3, 5]),
+    (lambda desa: desa.tx_with_hla('C*01:02'), []),
+    (lambda desa: desa.hla_class('I').desa_num(3), [1]),
+    (lambda desa: desa.early_failed(1/4), [1, 5]),
+    (lambda desa: desa.late_failed(10), [2]),
+    (lambda desa: desa.donor_type('Deceased').tx_with_hla('A*01:01'), [3, 5]),
+])
+def test_filters(desa_path, apply_filters, expected_output):
+    desa = DESA(desa_path)
+    assert apply_filters(desa).df.TransplantID.tolist() == expected_output
+
+
+def test_filters_share_the_base_frame(desa_path):
+    desa, other = DESA(desa_path), DESA(desa_path)
+    desa.donor_type('Living')
+    assert other.df is desa.base
+    assert len(desa.base) == 5
+
+
+def test_get_txs(desa_path):
+    desa = DESA(desa_path)
+    assert desa.get_txs([3, 1]).TransplantID.tolist() == [3, 1]
+    assert desa.get_tx(2)['Survival[Y]'].values[0] == 12.0
+    with pytest.raises(ValueError, match=r'\[6, 7\]'):
+        desa.get_txs([1, 6, 7])
+    with pytest.raises(ValueError):
+        desa.donor_type('Deceased').get_tx(1)
+
+
+def test_display_columns(desa_path):
+    display = DESA(desa_path).get_txs([1, 2], display=True)
+    assert list(display.columns) == ['TransplantID', '#DESA', 'Failure', 'Survival[Y]', 'Donor_HLA', 'Donor_HLA_Class']
+    assert display.Donor_HLA.tolist() == [str({'A*01:01', 'B*07:02'}), "{'A*02:01'}"]
+    assert display.Donor_HLA_Class.tolist() == ['I', 'I']
+
+
+def test_projection_and_filters(desa_path):
+    desa = DESA(desa_path, columns=['TransplantID', 'Donor_HLA', 'Donor_Type'], filters=[('Donor_Type', '=', 'Deceased')])
+    assert list(desa.base.columns) == ['TransplantID', 'Donor_HLA', 'Donor_Type']
+    assert desa.get_txs([4, 2], display=True).TransplantID.tolist() == [4, 2]
+    assert desa.tx_with_hla('A*01:01').df.TransplantID.tolist() == [3, 5]
+    # every projection is loaded once next to the full frame
+    assert DESA(desa_path, columns=['TransplantID', 'Donor_HLA', 'Donor_Type'], filters=[('Donor_Type', '=', 'Deceased')]).base is desa.base
+    assert len(DESA(desa_path).base) == 5
@@ -0,0 +1,40 @@
+""" test scripts for app.desa_sql.py """
+import os
+import itertools
+import pandas as pd
+import pytest
+from app.common.registry import REGISTRY
+from app.desa import DESA, read_desa_db
+from app.desa_sql import DesaSQL, compile_filters
+from app.tx_table import filtering_logic
+
+
+def test_compile_filters():
+    sql, parameters = compile_filters(sort_by='desa', hla='A*01:01', donor_type='Living')
+    assert sql.endswith('ORDER BY n_desa DESC, position')
+    assert parameters == ['Living', 'A*01:01']
+    with pytest.raises(KeyError):
+        compile_filters(hla_class='III')
+
+
+def test_sql_matches_pandas(desa_path):
+    for args in itertools.product(
+            [None, 'early_failure', 'late_surviving', 'desa'], [None, 'I', 'II'],
+            [None, 'A*01:01', 'C*01:02'], [None, 'Living', 'Deceased'], [None, True]):
+        expected_output = filtering_logic(DESA(desa_path), *args).TransplantID.tolist()
+        assert DesaSQL(desa_path).filter(*args).TransplantID.tolist() == expected_output
+
+
+def test_database_follows_the_frame(desa_path):
+    assert DesaSQL(desa_path).filter(donor_type='Living').TransplantID.tolist() == [1]
+    frame = pd.read_pickle(desa_path)
+    frame['TransplantID'] = [10, 20, 30, 40, 50]
+    frame['Donor_Type'] = ['Deceased', 'Deceased', 'Living', 'Living', 'Deceased']
+    frame.to_pickle(desa_path)
+    os.utime(desa_path, ns=(0, os.stat(desa_path).st_mtime_ns + 10**9))
+
+    key = (read_desa_db.__module__, read_desa_db.__qualname__, os.path.abspath(desa_path), None, None)
+    with REGISTRY._key_lock(key): # pylint: disable=protected-access
+        # another thread reloads the file, the former frame and its database are served
+        assert DesaSQL(desa_path).filter(donor_type='Living').TransplantID.tolist() == [1]
+    assert DesaSQL(desa_path).filter(donor_type='Living').TransplantID.tolist() == [30, 40]
@@ -16,6 +16,15 @@ def test_epvshla2hlavsep(test_input, expected_output):
 
 
 
+def test_hlavsep():
+    epitope = Epitope().ellipro(['High', 'Intermediate'])
+    hlavsep_df = epitope.hlavsep(only_with_pdb=True)
+    for hla, epitopes in zip(hlavsep_df.HLA, hlavsep_df.Epitope):
+        ind = epitope.df['Luminex Alleles'].apply(lambda x: hla in x)
+        assert epitopes == flatten2set(epitope.df[ind]['Epitope'].values)
+    assert set(hlavsep_df.HLA).issubset(epitope.pdb_inventory)
+
+
 def test_min_hlavsep():
     epitopes = set(['105S', '113HN', '114H', '114Q', '116L', '131S', '144QL',
                     '44RME', '62EE', '62QE', '63NI', '65QIA', '66IS', '66IY',
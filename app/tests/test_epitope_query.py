@@ -0,0 +1,75 @@
+""" test scripts for the EpitopeQuery of app.epitope.py """
+import logging
+import pandas as pd
+import pytest
+from app import epitope
+from app.epitope import Epitope, EpitopeQuery, build_lookups, load_epitope_db
+
+
+@pytest.fixture
+def base():
+    return pd.DataFrame({
+        'Epitope': ['1A', '2B', '3C', '4D'],
+        'mAb': pd.Categorical(['Yes', 'No', 'Yes', 'No']),
+        'isotype': pd.Categorical(['IgG', 'IgM', 'IgG, IgM', 'IgG']),
+        'ElliPro Score': pd.Categorical(['High', 'Low', 'High', 'Intermediate']),
+        'PolymorphicResidues': [[('1', 'A')], [('2', 'B')], [('3', 'C')], [('4', 'D'), ('5', 'E')]],
+    })
+
+
+def test_query_is_immutable(base):
+    query = EpitopeQuery(base)
+    filtered = query.mAb()
+    assert query.predicates == ()
+    assert query.df is base
+    assert filtered.df.Epitope.tolist() == ['1A', '3C']
+
+
+@pytest.mark.parametrize('build, expected_output',
+[
+    (lambda q: q.isotype('IgM'), ['2B', '3C']),
+    (lambda q: q.isotype().ellipro(['High']), ['1A', '3C']),
+    (lambda q: q.ellipro('Intermediate'), ['4D']),
+    (lambda q: q.epitopes('2B'), ['2B']),
+    (lambda q: q.mAb().epitopes(['1A', '2B', '3C']).isotype('IgM'), ['3C']),
+])
+def test_query_filters(base, build, expected_output):
+    assert build(EpitopeQuery(base)).df.Epitope.tolist() == expected_output
+
+
+def test_query_matches_apply(base):
+    plain = base.astype(str)
+    query = EpitopeQuery(plain).isotype('IgM').ellipro(['High', 'Low'])
+    ind = plain.isotype.apply(lambda x: 'IgM' in x) & plain['ElliPro Score'].apply(lambda x: x in ['High', 'Low'])
+    assert query.df.equals(plain[ind])
+
+
+def test_build_lookups(base):
+    lookups = build_lookups(base)
+    assert lookups['PolymorphicResidues']['4D'] == (('4', 'D'), ('5', 'E'))
+    assert lookups['isotype']['3C'] == 'IgG, IgM'
+    assert lookups['ElliPro Score']['2B'] == 'Low'
+    assert lookups['mAb'] == {'1A': True, '2B': False, '3C': True, '4D': False}
+
+
+def test_load_projection_and_filters(base, tmp_path):
+    path = str(tmp_path / 'epitopes.pickle')
+    base.to_pickle(path)
+    df, lookups = load_epitope_db(path, columns=['Epitope', 'mAb'], filters=[('mAb', 'in', ['Yes'])])
+    assert list(df.columns) == ['Epitope', 'mAb']
+    assert df.Epitope.tolist() == ['1A', '3C']
+    assert lookups == {'mAb': {'1A': True, '3C': True}}
+
+
+def test_inverted_index_is_shared(base, tmp_path, monkeypatch):
+    # no HLA inventory and no log files for this test
+    monkeypatch.setattr(epitope, 'load_pdb_inventory', lambda base_dir: frozenset())
+    monkeypatch.setattr(epitope, 'get_logger', lambda name, level: logging.getLogger(name))
+    path = str(tmp_path / 'epitopes.pickle')
+    base.assign(**{'Luminex Alleles': [['A*01:01'], ['A*01:01', 'B*07:02'], [], ['B*07:02']]}).to_pickle(path)
+    first = Epitope(path).filter_mAb()
+    assert first.allele_to_epitopes() == {'A*01:01': {'1A'}}
+    assert first.epitope_to_alleles() == {'1A': {'A*01:01'}}
+    # a new Epitope with the same filters reuses the index of the process
+    assert Epitope(path).filter_mAb().allele_to_epitopes() is first.allele_to_epitopes()
+    assert Epitope(path).allele_to_epitopes() == {'A*01:01': {'1A', '2B'}, 'B*07:02': {'2B', '4D'}}
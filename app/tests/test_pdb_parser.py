@@ -0,0 +1,65 @@
+""" test scripts for app.pdb_parser """
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import pytest
+from app.pdb_parser import read_atoms, build_atoms, create_data
+from app.structure import Structure
+
+PDB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'two_chains.pdb')
+
+
+def test_read_atoms():
+    atoms = read_atoms(PDB_PATH)
+    assert len(atoms) == 39
+    assert atoms['hetero'].sum() == 1
+    assert set(atoms['chain']) == {'A', 'B', 'W'}
+    first = atoms[0]
+    assert (first['serial'], first['name'], first['resname'], first['resid']) == (1, 'N', 'ALA', 1)
+    assert first['element'] == 'N'
+    assert atoms[1]['xyz'].tolist() == pytest.approx([1.458, 0.0, 0.0])
+
+
+@pytest.mark.parametrize('index, expected_output',
+    [
+        (0, {'name': 'N', 'chain': 'A', 'positions': [0.0, 0.0, 0.0], 'residue_index': 1,
+             'element': 'N', 'residue_name': 'ALA1', 'serial': 0}),
+        (23, {'name': 'CA', 'chain': 'B', 'positions': [6.203, -1.123, 3.597], 'residue_index': 5,
+              'element': 'C', 'residue_name': 'GLY1', 'serial': 23}),
+    ]
+)
+def test_build_atoms(index, expected_output):
+    assert build_atoms(read_atoms(PDB_PATH))[index] == expected_output
+
+
+def test_read_atoms_from_buffer():
+    with open(PDB_PATH, 'rb') as infile:
+        content = infile.read()
+    expected = read_atoms(PDB_PATH)
+    assert (read_atoms(content) == expected).all()
+    assert (read_atoms(io.BytesIO(content)) == expected).all()
+    assert (read_atoms(io.StringIO(content.decode())) == expected).all()
+
+
+def test_create_data_concurrent():
+    """ Stress test: many threads and processes parse at the same time and
+    must all get the same result, in the working directory nothing is created """
+    with open(PDB_PATH, 'rb') as infile:
+        content = infile.read()
+    expected = create_data(PDB_PATH)
+    files_before = set(os.listdir('.'))
+    sources = [PDB_PATH, content] * 100
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(create_data, sources))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        results += list(executor.map(create_data, sources[:8]))
+    assert all(result == expected for result in results)
+    assert set(os.listdir('.')) == files_before
+
+
+def test_residue_ranges():
+    structure = Structure.from_pdb(PDB_PATH)
+    assert structure.residue_ranges[('A', 1)] == [(0, 5)]
+    assert structure.residue_ranges[('B', 2)] == [(26, 32)]
+    assert structure.residue_atoms('W', 1) == [38]
+    assert structure.residue_atoms('A', 99) == []
@@ -0,0 +1,51 @@
+""" test scripts for app.set_cover """
+import pytest
+from app.set_cover import greedy_cover, exact_cover, uncovered_targets
+
+
+@pytest.mark.parametrize('candidates, targets, expected_output',
+[
+    ({'A*01:01': {'1A', '2B'}, 'A*02:01': {'1A', '2B', '3C'}, 'B*07:02': {'4D'}},
+     {'1A', '2B', '3C', '4D'},
+     {'A*02:01': {'1A', '2B', '3C'}, 'B*07:02': {'4D'}}),
+    # ties go to the first candidate, only the newly covered targets are assigned
+    ({'A': {'1', '2'}, 'B': {'2', '3'}, 'C': {'3', '4'}}, {'1', '2', '3', '4'},
+     {'A': {'1', '2'}, 'C': {'3', '4'}}),
+    ({'A': {'1'}}, {'2'}, {}),
+    ({}, {'1'}, {}),
+])
+def test_greedy_cover(candidates, targets, expected_output):
+    assert greedy_cover(candidates, targets) == expected_output
+
+
+def test_greedy_cover_beyond_ten_rounds():
+    candidates = {f'HLA{i}': {f'{i}A'} for i in range(40)}
+    targets = {f'{i}A' for i in range(40)} | {'unknown'}
+    cover = greedy_cover(candidates, targets)
+    assert len(cover) == 40
+    assert uncovered_targets(cover, targets) == {'unknown'}
+
+
+def test_exact_cover():
+    # greedy takes the big set first and needs three, the minimum is two
+    candidates = {'big': {'1', '2', '3', '4'}, 'left': {'1', '2', '5'}, 'right': {'3', '4', '6'},
+                  'small': {'5'}}
+    targets = {'1', '2', '3', '4', '5', '6'}
+    assert len(greedy_cover(candidates, targets)) == 3
+    cover, optimal = exact_cover(candidates, targets)
+    assert optimal
+    assert cover == {'left': {'1', '2', '5'}, 'right': {'3', '4', '6'}}
+
+
+def test_exact_cover_priority():
+    candidates = {'A*24:02': {'1', '2'}, 'A*02:01': {'1', '2'}, 'B*07:02': {'3'}}
+    cover, _ = exact_cover(candidates, {'1', '2', '3'}, priority={'A*02:01': 1})
+    assert set(cover) == {'A*02:01', 'B*07:02'}
+
+
+def test_exact_cover_time_budget():
+    candidates = {f'HLA{i}': {str(j) for j in range(60) if (i * 7 + j) % 9 < 3} for i in range(60)}
+    targets = {str(j) for j in range(60)}
+    cover, optimal = exact_cover(candidates, targets, time_budget=0)
+    assert not optimal
+    assert not uncovered_targets(cover, targets)
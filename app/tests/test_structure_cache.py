@@ -0,0 +1,101 @@
+""" test scripts for app.structure_cache """
+import os
+import shutil
+import numpy as np
+from app.pdb_parser import parse_structure
+from app.structure_archive import build_archive, StructureArchive
+from app.structure import sizeof
+from app.structure_cache import StructureCache
+
+PDB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'two_chains.pdb')
+
+
+def test_structure_cache(tmp_path):
+    pdb_path = str(tmp_path / 'A_02_01_V1.pdb')
+    shutil.copy(PDB_PATH, pdb_path)
+    cache_dir = str(tmp_path / 'cache')
+    expected_atoms, expected_bonds = parse_structure(pdb_path)
+
+    cache = StructureCache(cache_dir)
+    structure = cache.get(pdb_path)
+    atoms, bonds = structure.atoms, structure.bonds
+    assert cache.get(pdb_path) is structure
+    assert cache.stats == {'memory': 1, 'archive': 0, 'disk': 0, 'parsed': 1}
+    assert (atoms == expected_atoms).all() and (bonds == expected_bonds).all()
+    assert not atoms.flags.writeable
+
+    # a fresh process reads the .npz instead of parsing
+    cache = StructureCache(cache_dir)
+    structure = cache.get(pdb_path)
+    atoms, bonds = structure.atoms, structure.bonds
+    assert cache.stats == {'memory': 0, 'archive': 0, 'disk': 1, 'parsed': 0}
+    assert (atoms == expected_atoms).all() and (bonds == expected_bonds).all()
+
+    # a changed file is parsed again and replaces the stale .npz
+    with open(pdb_path, 'a') as outfile:
+        outfile.write('HETATM   42  O   HOH W   2      40.000  40.000  40.000  1.00 20.00           O\n')
+    os.utime(pdb_path, ns=(0, os.stat(pdb_path).st_mtime_ns + 10**9))
+    assert len(cache.get(pdb_path)) == len(expected_atoms) + 1
+    assert cache.stats['parsed'] == 1
+    assert len(os.listdir(cache_dir)) == 1
+
+
+def test_structure_cache_memory_ceiling(tmp_path):
+    paths = []
+    for name in ['A_01_01_V1.pdb', 'A_02_01_V1.pdb', 'A_03_01_V1.pdb']:
+        paths.append(str(tmp_path / name))
+        shutil.copy(PDB_PATH, paths[-1])
+    atoms, bonds = parse_structure(PDB_PATH)
+    cache = StructureCache(None, max_bytes=2 * (atoms.nbytes + bonds.nbytes))
+    for path in paths:
+        cache.get(path)
+    assert cache.nbytes == 2 * (atoms.nbytes + bonds.nbytes)
+    cache.get(paths[0])
+    assert cache.stats == {'memory': 0, 'archive': 0, 'disk': 0, 'parsed': 4}
+
+
+def test_structure_cache_counts_derived_objects(tmp_path):
+    paths = []
+    for name in ['A_01_01_V1.pdb', 'A_02_01_V1.pdb']:
+        paths.append(str(tmp_path / name))
+        shutil.copy(PDB_PATH, paths[-1])
+    atoms, bonds = parse_structure(PDB_PATH)
+    cache = StructureCache(None, max_bytes=2 * (atoms.nbytes + bonds.nbytes))
+    first, second = cache.get(paths[0]), cache.get(paths[1])
+    assert cache.nbytes == first.nbytes + second.nbytes
+
+    # the modelData is counted in the structure and in the cache
+    model = second.model
+    assert second.model is model
+    assert second.nbytes > atoms.nbytes + bonds.nbytes + sizeof(model['atoms'][0])
+    assert cache.nbytes == second.nbytes
+    # which pushes the least recently used structure out
+    assert cache.get(paths[1]) is second
+    assert cache.get(paths[0]) is not first
+
+
+def test_structure_archive(tmp_path):
+    base_dir = tmp_path / 'HLAMolecule'
+    for locus, name in [('A', 'A_02_01_V1.pdb'), ('DQ', 'DQA1_01_03-DQB1_06_01_V1.pdb')]:
+        (base_dir / locus).mkdir(parents=True)
+        shutil.copy(PDB_PATH, str(base_dir / locus / name))
+    archive_dir = str(tmp_path / 'archive')
+    build_archive(str(base_dir), archive_dir)
+
+    archive = StructureArchive(archive_dir)
+    assert set(archive.hlas) == {'A*02:01', 'DQA1*01:03', 'DQB1*06:01'}
+    expected_atoms, expected_bonds = parse_structure(PDB_PATH)
+    atoms, bonds = archive.get_hla('DQB1*06:01')
+    assert (atoms == expected_atoms).all() and (bonds == expected_bonds).all()
+    # lookups are views on the memory-mapped arrays
+    assert isinstance(atoms, np.memmap) and isinstance(bonds, np.memmap)
+    assert atoms.base is not None and not atoms.flags.writeable and not bonds.flags.writeable
+
+    pdb_path = str(base_dir / 'A' / 'A_02_01_V1.pdb')
+    cache = StructureCache(None, archive=archive)
+    cache.get(pdb_path)
+    assert cache.stats['archive'] == 1
+    # a file changed after the build is parsed again
+    os.utime(pdb_path, ns=(0, os.stat(pdb_path).st_mtime_ns + 10**9))
+    cache.get(pdb_path)
+    assert cache.stats['parsed'] == 1
@@ -0,0 +1,42 @@
+""" test scripts for app.styles_parser """
+import os
+import json
+import pytest
+from app.structure import Structure
+from app.styles_parser import base_style, create_style
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+PDB_PATH = os.path.join(DATA_DIR, 'two_chains.pdb')
+DESA_INFO = {'chain': 'A', 'desa': {'2': 'S', '3': 'C'}, 'desa_rAb': {3}, 'desa_mAb': {1}}
+
+with open(os.path.join(DATA_DIR, 'two_chains_styles.json')) as infile:
+    EXPECTED_STYLES = json.load(infile)
+
+
+@pytest.mark.parametrize('mol_color', ['chain', 'residue', 'residue_type', 'atom'])
+def test_create_style(mol_color):
+    expected_output = EXPECTED_STYLES[mol_color]
+    assert json.loads(create_style(PDB_PATH, 'sphere', mol_color, DESA_INFO)) == expected_output
+    structure = Structure.from_pdb(PDB_PATH)
+    assert json.loads(create_style(structure, 'sphere', mol_color, DESA_INFO)) == expected_output
+
+
+def test_create_style_reuses_base_style():
+    structure = Structure.from_pdb(PDB_PATH)
+    no_desa = {'chain': 'A', 'desa': {}, 'desa_rAb': set(), 'desa_mAb': set()}
+    base_output = json.loads(create_style(structure, 'sphere', 'chain', no_desa))
+    base = base_style(structure, 'sphere', 'chain')
+    assert json.loads(create_style(structure, 'sphere', 'chain', DESA_INFO)) == EXPECTED_STYLES['chain']
+    # the overlay of a request does not leak into the cached base style
+    assert base_style(structure, 'sphere', 'chain') is base
+    assert json.loads(create_style(structure, 'sphere', 'chain', no_desa)) == base_output
+
+
+def test_base_style_is_counted():
+    structure = Structure.from_pdb(PDB_PATH)
+    grown = []
+    structure.on_grow = lambda structure, added: grown.append(added)
+    nbytes = structure.nbytes
+    base_style(structure, 'sphere', 'chain')
+    base_style(structure, 'sphere', 'chain')
+    assert structure.nbytes == nbytes + sum(grown) and len(grown) == 1
@@ -0,0 +1,31 @@
+""" test scripts for app.tx_export.py """
+import io
+import pandas as pd
+import pytest
+from app import tx_export
+from app.tx_export import iter_csv, iter_parquet
+
+
+def test_iter_csv(desa_path):
+    chunks = list(iter_csv([4, 1, 5], desa_path, chunk_size=2))
+    assert len(chunks) == 2
+    df = pd.read_csv(io.StringIO(''.join(chunks)))
+    assert df.TransplantID.tolist() == [4, 1, 5]
+    assert df['Survival[Y]'].tolist() == [0.0, 0.123, 0.2]
+    assert list(pd.read_csv(io.StringIO(''.join(iter_csv([], desa_path)))).columns) == list(df.columns)
+
+
+def test_iter_parquet(desa_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    parquet = pq.ParquetFile(io.BytesIO(b''.join(iter_parquet([4, 1, 5], desa_path, chunk_size=2))))
+    assert parquet.num_row_groups == 2
+    assert parquet.read().to_pandas().TransplantID.tolist() == [4, 1, 5]
+
+
+def test_iter_parquet_without_pyarrow(desa_path, monkeypatch):
+    def import_pyarrow():
+        raise ImportError('pyarrow')
+    monkeypatch.setattr(tx_export, 'import_pyarrow', import_pyarrow)
+    # raised before the first chunk, i.e. before the response is started
+    with pytest.raises(ImportError):
+        iter_parquet([4, 1, 5], desa_path)
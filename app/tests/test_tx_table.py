@@ -0,0 +1,83 @@
+""" test scripts for app.tx_table.py """
+import itertools
+import pytest
+from app.desa import DESA
+from app.tx_table import store_ids, ordered_ids, page_frame, page_count, FilterCache, normalise_filters, filtered_ids, FILTER_FIELDS
+
+
+def test_pages(desa_path):
+    token = store_ids(DESA(desa_path).tx_with_hla('A*01:01').df.TransplantID, desa_path)
+    assert page_frame(token, 0, 2, path=desa_path).TransplantID.tolist() == [1, 3]
+    assert page_frame(token, 1, 2, path=desa_path).TransplantID.tolist() == [5]
+    assert page_frame('expired', 0, 2, path=desa_path) is None
+    assert page_count(3, 2) == 2 and page_count(0, 2) == 1
+
+
+def test_pages_of_an_unknown_token(desa_path):
+    # the token was issued by another worker, the page is computed from the stored filters
+    filters = list(normalise_filters(hla='A*01:01', donor_type='Deceased'))
+    cache = FilterCache(path=desa_path)
+    page = page_frame('other-worker', 0, 1, path=desa_path, filters=filters, cache=cache)
+    assert page.TransplantID.tolist() == [3]
+    assert ordered_ids('other-worker', path=desa_path) == [3, 5]
+    assert page_frame('other-worker', 1, 1, path=desa_path, filters=filters, cache=cache).TransplantID.tolist() == [5]
+    assert cache.stats['misses'] == 1
+
+
+def test_sorted_pages(desa_path):
+    token = store_ids(DESA(desa_path).df.TransplantID, desa_path)
+    sort_by = [{'column_id': '#DESA', 'direction': 'desc'}]
+    assert ordered_ids(token, sort_by, desa_path) == [4, 1, 5, 3, 2]
+    assert page_frame(token, 0, 2, sort_by, desa_path).TransplantID.tolist() == [4, 1]
+    sort_by = [{'column_id': 'Survival[Y]', 'direction': 'desc'}]
+    assert ordered_ids(token, sort_by, desa_path) == [2, 3, 5, 1, 4]
+
+
+def test_filter_cache(desa_path):
+    cache = FilterCache(path=desa_path, refine_fraction=1)
+    computed = []
+    def compute():
+        computed.append(True)
+        return DESA(desa_path).donor_type('Deceased').df.TransplantID.tolist()
+
+    deceased = normalise_filters(donor_type='Deceased', hla='')
+    assert cache.ids(deceased, compute) == [2, 3, 4, 5]
+    assert cache.ids(normalise_filters(donor_type='Deceased'), compute) == [2, 3, 4, 5]
+    # narrower filters are refined from the cached ids
+    assert cache.ids(normalise_filters(sort_by='desa', hla=' A*01:01', donor_type='Deceased'), compute) == [5, 3]
+    assert len(computed) == 1
+    assert cache.stats == {'hits': 1, 'misses': 2, 'size': 2, 'refined': 1}
+
+
+def test_filter_cache_skips_large_supersets(desa_path):
+    cache = FilterCache(path=desa_path)
+    assert filtered_ids(cache=cache) == [1, 2, 3, 4, 5]
+    # the unfiltered table is not refined
+    assert filtered_ids(hla='A*01:01', cache=cache) == [1, 3, 5]
+    # neither is a cached table of more than refine_fraction of the rows
+    assert filtered_ids(hla='A*01:01', donor_type='Deceased', cache=cache) == [3, 5]
+    assert cache.stats['refined'] == 0
+    assert filtered_ids(hla='A*01:01', donor_type='Deceased', sort_by='desa', cache=cache) == [5, 3]
+    assert cache.stats['refined'] == 1
+
+
+def test_refined_ids_match_computed_ids(desa_path):
+    combinations = [dict(zip(FILTER_FIELDS, values)) for values in itertools.product(
+        [None, 'Deceased'], [None, True], [None, 'I'], [None, 'A*01:01'], [None, 'early_failure', 'desa'])]
+    for cached in combinations:
+        cache = FilterCache(path=desa_path, refine_fraction=1)
+        filtered_ids(**cached, cache=cache)
+        for filters in combinations:
+            if all(cached[field] is None or cached[field] == filters[field] for field in FILTER_FIELDS):
+                expected_output = filtered_ids(**filters, cache=FilterCache(path=desa_path))
+                assert filtered_ids(**filters, cache=cache) == expected_output
+
+
+@pytest.mark.parametrize('backend', ['pandas', 'sqlite'])
+def test_filtered_ids(desa_path, backend):
+    cache = FilterCache(path=desa_path)
+    # the ids are computed from the stripped HLA they are cached under
+    assert filtered_ids(hla='A*01:01 ', donor_type='Deceased', backend=backend, cache=cache) == [3, 5]
+    assert filtered_ids(hla='A*01:01', donor_type='Deceased', backend=backend, cache=cache) == [3, 5]
+    assert filtered_ids(sort_by='desa', backend=backend, cache=cache) == [4, 1, 5, 3, 2]
+    assert cache.stats == {'hits': 1, 'misses': 2, 'size': 2, 'refined': 0}
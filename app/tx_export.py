@@ -0,0 +1,79 @@
+""" Streaming export of the filtered transplant table. The rows are selected from the
+DESA TransplantID index one chunk at a time and every chunk is serialised and yielded
+before the next one is read, so an export of the whole cohort stays within the memory
+of one chunk. CSV chunks are plain text, Parquet chunks are the bytes of one row group """
+from typing import Iterator, List
+
+from app.desa import DESA, DESA_PATH
+from app.common.columnar import import_pyarrow
+
+CHUNK_SIZE = 5000
+
+
+def _chunks(ids:List[int], path:str, chunk_size:int):
+    """ Display rows of the transplants, chunk_size transplants at a time """
+    desa = DESA(path)
+    for start in range(0, len(ids), chunk_size):
+        yield desa.get_txs(ids[start:start + chunk_size], display=True)
+
+
+def iter_csv(ids:List[int], path:str=DESA_PATH, chunk_size:int=CHUNK_SIZE) -> Iterator[str]:
+    """ The table of the transplants as CSV text chunks, the first one holds the header """
+    header = True
+    for chunk in _chunks(ids, path, chunk_size):
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+    if header:
+        yield DESA(path).display.iloc[:0].to_csv(index=False)
+
+
+class _ChunkSink:
+    """ Write-only file object that hands out what was written since the last drain """
+
+    def __init__(self):
+        self.closed = False
+        self._buffer = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._buffer.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data, self._buffer = b''.join(self._buffer), []
+        return data
+
+
+def iter_parquet(ids:List[int], path:str=DESA_PATH, chunk_size:int=CHUNK_SIZE) -> Iterator[bytes]:
+    """ The table of the transplants as a Parquet file, yielded one row group at a time.
+    pyarrow is imported when the iterator is created, so a missing pyarrow raises
+    ImportError before the response is started """
+    pa, pq = import_pyarrow()
+    return _iter_parquet(pa, pq, ids, path, chunk_size)
+
+
+def _iter_parquet(pa, pq, ids:List[int], path:str, chunk_size:int) -> Iterator[bytes]: # pylint: disable=invalid-name
+    sink, writer = _ChunkSink(), None
+    for chunk in _chunks(ids, path, chunk_size):
+        if writer is None:
+            # the schema is taken from the first chunk, object columns of an empty frame have no type
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            writer = pq.ParquetWriter(sink, table.schema)
+        else:
+            table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+        writer.write_table(table)
+        yield sink.drain()
+    if writer is None:
+        writer = pq.ParquetWriter(sink, pa.Schema.from_pandas(DESA(path).display.iloc[:0], preserve_index=False))
+    writer.close()
+    yield sink.drain()
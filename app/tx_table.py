@@ -0,0 +1,209 @@
+""" Server side state of the paginated transplant table of the Data tab.
+The filtered table is computed once per "Show Table" click and only its ordered
+TransplantIDs are cached under a token that the browser keeps in a dcc.Store,
+next to the normalised filters. A worker that does not know the token (it was
+issued by another process or expired) computes the ids again from the filters.
+Page and sort events select the rows of the visible page from the DESA
+TransplantID index, so the payload does not grow with the number of records.
+The ordered TransplantIDs of every filter combination are cached as well, and a
+combination that narrows a cached one is refined from the cached rows only """
+import math
+import uuid
+from typing import Callable, List, Tuple, Union
+
+import pandas as pd
+
+from app.common.cache import LRUCache, file_version
+from app.desa import DESA, DESA_PATH
+from app.desa_sql import DesaSQL
+
+# Order of the fields of a normalised filter tuple
+FILTER_FIELDS = ('donor_type', 'exclude_nev', 'hla_class', 'hla', 'sort_by')
+
+PAGE_SIZE = 20
+
+# Ordered TransplantIDs keyed on (token, sort column, sort direction)
+TABLE_IDS = LRUCache(maxsize=256, ttl=3600)
+
+
+def _sync_version(path:str):
+    """ The cached ids are dropped when the DESA data changes """
+    TABLE_IDS.set_version(file_version(path))
+
+
+def store_ids(ids:List[int], path:str=DESA_PATH, token:str=None) -> str:
+    """ Caches the ordered TransplantIDs of a filtered table, returns its token
+    token: the token the ids are stored under, a new one by default """
+    _sync_version(path)
+    token = token or uuid.uuid4().hex
+    TABLE_IDS.set((token, None, None), list(ids))
+    return token
+
+
+def page_count(n_records:int, page_size:int=PAGE_SIZE) -> int:
+    return max(1, math.ceil(n_records / page_size))
+
+
+def ordered_ids(token:str, sort_by:List[dict]=None, path:str=DESA_PATH) -> List[int]:
+    """ The TransplantIDs of a token in the order of the DataTable sort_by,
+    None if the token expired or the data changed """
+    _sync_version(path)
+    ids = TABLE_IDS.get((token, None, None))
+    if ids is None or not sort_by:
+        return ids
+    column, direction = sort_by[0]['column_id'], sort_by[0]['direction']
+    key = (token, column, direction)
+    sorted_ids = TABLE_IDS.get(key)
+    if sorted_ids is None:
+        # columns are sorted as they are displayed
+        rows = DESA(path).get_txs(ids, display=True)
+        order = rows[column].reset_index(drop=True).sort_values(ascending=direction == 'asc', kind='stable').index
+        sorted_ids = rows.TransplantID.iloc[order].tolist()
+        TABLE_IDS.set(key, sorted_ids)
+    return sorted_ids
+
+
+def page_frame(token:str,
+               page_current:int,
+               page_size:int=PAGE_SIZE,
+               sort_by:List[dict]=None,
+               path:str=DESA_PATH,
+               filters:Tuple=None,
+               backend:str='pandas',
+               cache:'FilterCache'=None) -> pd.DataFrame:
+    """
+    The display rows of one page of a cached table
+    filters: the normalised filters of the table, its ids are computed again through the
+    filter cache when the token is unknown to this process. Without them an unknown
+    token returns None
+    backend, cache: see filtered_ids
+    """
+    ids = ordered_ids(token, sort_by, path)
+    if ids is None:
+        if filters is None:
+            return None
+        store_ids(filtered_ids(**dict(zip(FILTER_FIELDS, filters)), backend=backend, cache=cache), path, token)
+        ids = ordered_ids(token, sort_by, path)
+    page_current = page_current or 0
+    return DESA(path).get_txs(ids[page_current * page_size:(page_current + 1) * page_size], display=True)
+
+
+def filtering_logic(desa: Union[DESA, DesaSQL], sort_by:str, hla_class:str, hla:str, donor_type:str, exclude_nev:bool):
+    """ This function wraps all the logic pertain to filtering the table.
+    The SQLite backend runs all the filters as one query """
+    if isinstance(desa, DesaSQL):
+        return desa.filter(sort_by, hla_class, hla, donor_type, exclude_nev)
+    if donor_type:
+        desa.donor_type(donor_type)
+    if exclude_nev:
+        desa.graft_function(exclude='NEV')
+    if hla_class:
+        desa.hla_class(hla_class)
+    if hla:
+        desa.tx_with_hla(hla)
+    if sort_by:
+        if sort_by == 'early_failure':
+            desa.early_failed(1/4)
+        if sort_by == 'late_surviving':
+            desa.late_failed(10)
+        if sort_by == 'desa':
+            return desa.df.sort_values(by='#DESA', ascending=False, kind='stable')
+    return desa.df
+
+
+def normalise_filters(sort_by:str=None,
+                      hla_class:str=None,
+                      hla:str=None,
+                      donor_type:str=None,
+                      exclude_nev:bool=None) -> Tuple:
+    """ The filters of filtering_logic as a tuple in FILTER_FIELDS order,
+    unset filters (None, '' or False) are None """
+    hla = hla.strip() if hla else None
+    return (donor_type or None, True if exclude_nev else None, hla_class or None, hla or None, sort_by or None)
+
+
+def _narrows(cached:Tuple, filters:Tuple) -> bool:
+    """ True if the filters only add conditions to the cached filters """
+    return all(old is None or old == new for old, new in zip(cached, filters))
+
+
+def refine_ids(desa:DESA, ids:List[int], cached:Tuple, filters:Tuple) -> List[int]:
+    """ Applies the filters that are not in cached to the transplants of the cached TransplantIDs.
+    The ids are selected through the DESA mask and the added filters run as the vectorized and
+    indexed DESA filters, the order is the one filtering_logic gives the full filters """
+    added = {
+        field: new if old is None else None for field, old, new in zip(FILTER_FIELDS, cached, filters)
+    }
+    # the sort of the cached filters is applied again, narrower filters keep it
+    added['sort_by'] = filters[FILTER_FIELDS.index('sort_by')]
+    return filtering_logic(desa.tx_ids(ids), **added).TransplantID.tolist()
+
+
+class FilterCache:
+    """ Bounded cache of the ordered TransplantIDs of the filtered table keyed on the
+    normalised filter tuple, all entries are dropped when the DESA data changes """
+
+    def __init__(self, maxsize:int=128, path:str=DESA_PATH, refine_fraction:float=0.5):
+        """
+        refine_fraction: a cached filter combination is only refined when it holds at most this
+        fraction of the table, larger ones are not cheaper than the indexed computation
+        """
+        self.path = path
+        self.refine_fraction = refine_fraction
+        self.refined = 0
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def __repr__(self):
+        return f""" FilterCache(stats={self.stats}) """
+
+    @property
+    def stats(self) -> dict:
+        return {**self._cache.stats, 'refined': self.refined}
+
+    def ids(self, filters:Tuple, compute:Callable[[], List[int]]) -> List[int]:
+        """
+        The ordered TransplantIDs of the normalised filters
+        compute: computes the ids from the full table, used when no small enough cached
+        filter combination is narrowed by the filters
+        """
+        self._cache.set_version(file_version(self.path))
+        ids = self._cache.get(filters)
+        if ids is not None:
+            return ids
+        # the unfiltered table is never refined, it is the whole cohort
+        supersets = [
+            (cached, ids) for cached, ids in self._cache.items()
+            if _narrows(cached, filters) and any(value is not None for value in cached)
+        ]
+        smallest = min(supersets, key=lambda item: len(item[1]), default=None)
+        desa = DESA(self.path)
+        if smallest is not None and len(smallest[1]) <= self.refine_fraction * len(desa.base):
+            ids = refine_ids(desa, smallest[1], smallest[0], filters)
+            self.refined += 1
+        else:
+            ids = compute()
+        self._cache.set(filters, ids)
+        return ids
+
+
+# Process wide cache used by the table callback
+FILTER_CACHE = FilterCache()
+
+
+def filtered_ids(sort_by:str=None,
+                 hla_class:str=None,
+                 hla:str=None,
+                 donor_type:str=None,
+                 exclude_nev:bool=None,
+                 backend:str='pandas',
+                 cache:FilterCache=None) -> List[int]:
+    """ The ordered TransplantIDs of the table filters, shared by the table and the export.
+    The ids are computed from the normalised filters they are cached under
+    backend: 'pandas' (DESA) or 'sqlite' (DesaSQL)
+    cache: FilterCache of the DESA file, FILTER_CACHE by default """
+    cache = FILTER_CACHE if cache is None else cache
+    filters = normalise_filters(sort_by, hla_class, hla, donor_type, exclude_nev)
+    def compute():
+        desa = DesaSQL(cache.path) if backend == 'sqlite' else DESA(cache.path)
+        return filtering_logic(desa, **dict(zip(FILTER_FIELDS, filters))).TransplantID.tolist()
+    return cache.ids(filters, compute)
@@ -1,16 +1,18 @@
 """ This file encompass all the 3D visualisation scripts"""
-import json
 import logging
+from copy import deepcopy
 from typing import Set, Dict, Union
 from collections import defaultdict
 from dash_bio import Molecule3dViewer
 import dash_bootstrap_components as dbc
 import dash_html_components as html
 from app.common.logger import get_logger
+from app.common.cache import LRUCache, file_version
 
 from app.epitope import Epitope
 from app.desa import DESA
-from app import styles_parser as sparser, pdb_parser as parser
+from app import styles_parser as sparser
+from app.structure_cache import STRUCTURE_CACHE
 from app.common.utilities import (
     get_hla_exp,
     get_hla_polychain,
@@ -20,6 +22,9 @@ from app.common.utilities import (
 
 SERVICE_NAME = 'VisualiseHLA'
 
+# Memoized epitope covers, keyed on the canonical from_epitopes inputs
+EPITOPE_COVER_CACHE = LRUCache(maxsize=256, ttl=24 * 3600)
+
 class VisualiseHLA:
 
     def __init__(self, ignore_hla:set=set(),  path_desa=None, path_epitope=None):
@@ -71,8 +76,9 @@ class VisualiseHLA:
             pdb_exist, pdb_path = find_molecule_path(locus, filename)
             if pdb_exist:
                 try:
-                    model_data = parser.create_data(pdb_path)
-                    style_data = sparser.create_style(pdb_path, style, mol_color='chain', desa_info=desa_info)
+                    structure = STRUCTURE_CACHE.get(pdb_path)
+                    model_data = structure.model
+                    style_data = sparser.build_style(structure, style, mol_color='chain', desa_info=desa_info)
                     vis_data[hla] = {'model':model_data, 'style':style_data}
                     self.log.info(f'Successfully loaded & parsed this file', extra={'messagePrefix': called_by})
                 except:
@@ -85,10 +91,16 @@ class VisualiseHLA:
                 continue
         return vis_data
 
-    def _get_min_hlavsep(self, epitopes:set, most_freq_hla:bool=True) -> dict:
+    def _get_min_hlavsep(self,
+                        epitopes:set,
+                        most_freq_hla:bool=True,
+                        exact:bool=False,
+                        time_budget:float=1.0) -> dict:
         if not isinstance(epitopes, set):
             raise TypeError('Epitopes should be given as a set')
-        return self.epitope.min_hlavsep(epitopes, ignore_hla=self.ignore_hla, most_freq_hla=most_freq_hla)
+        return self.epitope.min_hlavsep(
+            epitopes, ignore_hla=self.ignore_hla, most_freq_hla=most_freq_hla, exact=exact, time_budget=time_budget
+        )
 
     def _keep_hla_with_pdb(self, hlavsep:dict) -> dict:
         """
@@ -112,15 +124,13 @@ class VisualiseHLA:
         """ An internal method to get hla vs polymorphic epitopes dictionary from
         hla vs epitopes dictionary  """
 
-        ep_db = self.epitope.df
         _hlavsep = defaultdict(lambda: defaultdict(list))
         for hla in hlavsep.keys():
             for ep in hlavsep[hla]:
                 _hlavsep[hla]['desa'].append(ep)
                 _hlavsep[hla]['_desa'].extend(self.epitope.polymorphic_residues(ep))
                 try:
-                    ind = ep_db.Epitope == ep
-                    if mAb & (ep_db[ind]['isotype'].values[0] == 'IgG'):
+                    if mAb & (self.epitope.lookup(ep, 'isotype') == 'IgG'):
                         _hlavsep[hla]['desa_mAb'].append(ep)
                         _hlavsep[hla]['_desa_mAb'].extend(self.epitope.polymorphic_residues(ep))
                 except IndexError:
@@ -135,24 +145,55 @@ class VisualiseHLA:
                     style:str='sphere',
                     mAb:bool=False,
                     elliproscore:Union[set, list, str]=None,
+                    exact:bool=False,
+                    time_budget:float=1.0,
+                    most_freq_hla:bool=True,
         ) -> Dict[str, set]:
         """
         Prepare 3D visualisation data from epitopes as input. This method finds the
         minimum number of hla on which all the epitopes can be located and return a dict
         {'hla': {'ep'} }
+        exact: use the exact minimum cover (within time_budget seconds) instead of the
+        greedy one, fewer HLA means fewer structures to parse and render
+        The cover and its polymorphic residues are memoized on the canonical inputs,
+        the version of the epitope data base and the HLA inventory of .pdb files.
         """
 
         self.log.info(f'Start with Epitopes {epitopes}', extra={'messagePrefix': 'from_epitopes'})
         if not isinstance(epitopes, set):
             raise TypeError('Epitopes should be given as a set')
 
-        # filter epitope df (under the hood) by ellipro score
-        if elliproscore:
-            self.epitope.ellipro(elliproscore)
+        # the cover only holds HLA with a .pdb file, the inventory snapshot of the epitope
+        # db is part of the version, it is replaced when a structure is added or removed
+        version = (file_version(self.epitope.path), self.epitope.pdb_inventory)
+        key = (
+            frozenset(epitopes),
+            frozenset(self.ignore_hla),
+            frozenset([elliproscore] if isinstance(elliproscore, str) else elliproscore or []),
+            bool(mAb),
+            most_freq_hla,
+            exact,
+            time_budget if exact else None,
+            version,
+        )
+        EPITOPE_COVER_CACHE.set_version(version)
+        cached = EPITOPE_COVER_CACHE.get(key)
+        if cached is None:
+            # filter epitope df (under the hood) by ellipro score
+            if elliproscore:
+                self.epitope.ellipro(elliproscore)
 
-        _min_hlavsep = self._get_min_hlavsep(epitopes)
-        self.log.info(f'min HLA vs Epitope is:{list(_min_hlavsep.keys())}', extra={'messagePrefix': 'from_epitopes'})
-        hlavspolyep = self._hlavsep_poly(_min_hlavsep, mAb)
+            _min_hlavsep = self._get_min_hlavsep(
+                epitopes, most_freq_hla=most_freq_hla, exact=exact, time_budget=time_budget
+            )
+            hlavspolyep = {hla: dict(poly) for hla, poly in self._hlavsep_poly(_min_hlavsep, mAb).items()}
+            cached = (_min_hlavsep, hlavspolyep)
+            EPITOPE_COVER_CACHE.set(key, cached)
+        _min_hlavsep, hlavspolyep = deepcopy(cached)
+        self.log.info(
+            f'min HLA vs Epitope is:{list(_min_hlavsep.keys())}, cover cache {EPITOPE_COVER_CACHE.stats}',
+            extra={'messagePrefix': 'from_epitopes'}
+        )
         vis_data = self._get_vis_data_from_pdb(hlavspolyep, style, 'from_epitopes')
         self.vis_data_from_epitopes = vis_data
         self.hlavsep = _min_hlavsep
@@ -182,11 +223,10 @@ class VisualiseHLA:
         vis_data = defaultdict(dict)
         txvshlavsep = defaultdict(dict)
 
-        for TxID in TxIDs:
-            epvshla = self.desa.get_tx(TxID).EpvsHLA_Donor.values[0]
+        transplants = self.desa.get_txs(TxIDs).drop_duplicates('TransplantID')
+        for TxID, epvshla in zip(transplants.TransplantID, transplants.EpvsHLA_Donor):
             # Apply ellipro filter to epitopes
-            epvshla = {ep:epvshla[ep] for ep in epvshla.keys()
-                                        if ep in set(self.epitope.df.Epitope.values.tolist()) }
+            epvshla = {ep:epvshla[ep] for ep in epvshla.keys() if ep in self.epitope.epitopes()}
             hlavsep = self.epitope.epvshla2hlavsep(epvshla)
             # Keep HLA's for which a pdb file exist
             hlavsep = self._keep_hla_with_pdb(hlavsep)
@@ -204,12 +244,12 @@ class VisualiseHLA:
             'Preparing the visualisation payload', extra={'messagePrefix': f'TXID:{TxID}, HLA:{hla}'}
         )
         if self.hlavsep: # this attribute is updated by from_epitopes method
-            model_data = json.loads(self.vis_data_from_epitopes.get(hla).get('model'))
-            style_data = json.loads(self.vis_data_from_epitopes.get(hla).get('style'))
+            model_data = self.vis_data_from_epitopes.get(hla).get('model')
+            style_data = self.vis_data_from_epitopes.get(hla).get('style')
 
         elif self.txvshlavsep: # this attribute is updated by from_transplants method
-            model_data = json.loads(self.vis_data_from_transplants.get(TxID).get(hla).get('model'))
-            style_data = json.loads(self.vis_data_from_transplants.get(TxID).get(hla).get('style'))
+            model_data = self.vis_data_from_transplants.get(TxID).get(hla).get('model')
+            style_data = self.vis_data_from_transplants.get(TxID).get(hla).get('style')
         return self._molecule_viewer(model_data, style_data, opacity=0.6)
 
 ####################################################
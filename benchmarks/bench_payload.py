@@ -0,0 +1,60 @@
+""" Benchmark of the serialisation work per HLA between parsing and the viewer:
+model and style encoded to JSON strings, decoded again by visualise3D and encoded
+by Dash, versus native objects that are only encoded once by Dash.
+
+Run from the repository root with
+    python -m benchmarks.bench_payload [pdb files]
+"""
+import sys
+import glob
+import json
+import timeit
+
+from app import styles_parser
+from app.structure import Structure
+
+FIXTURE = './app/tests/data/two_chains.pdb'
+DESA_INFO = {'chain': 'A', 'desa': {'62': 'E', '65': 'Q'}, 'desa_rAb': set(), 'desa_mAb': {62}}
+
+try:
+    # the encoder Dash uses for its responses
+    from plotly.utils import PlotlyJSONEncoder
+except ImportError:
+    PlotlyJSONEncoder = json.JSONEncoder
+
+
+def dash_encode(payload):
+    return json.dumps(payload, cls=PlotlyJSONEncoder)
+
+
+def json_round_trip(structure):
+    """ encode in the parser, decode in visualise3D, encode in Dash """
+    model = json.dumps(structure.to_model())
+    style = styles_parser.create_style(structure, 'sphere', mol_color='chain', desa_info=DESA_INFO)
+    return dash_encode({'modelData': json.loads(model), 'styles': json.loads(style)})
+
+
+def native(structure):
+    """ native objects up to the single encode in Dash """
+    model = structure.model
+    style = styles_parser.build_style(structure, 'sphere', mol_color='chain', desa_info=DESA_INFO)
+    return dash_encode({'modelData': model, 'styles': style})
+
+
+def bench(pdb_paths, repeat=5):
+    """ Returns the best mean per-HLA time in ms of both approaches """
+    structures = [Structure.from_pdb(path) for path in pdb_paths]
+    results = {}
+    for func in (json_round_trip, native):
+        timer = timeit.Timer(lambda: [func(structure) for structure in structures])
+        results[func.__name__] = min(timer.repeat(repeat, number=1)) / len(structures) * 1000
+    return results
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or sorted(glob.glob('./data/HLAMolecule/*/*.pdb'))[:20] or [FIXTURE]
+    timings = bench(paths)
+    print(f'{len(paths)} .pdb files, per HLA:')
+    for name, ms in timings.items():
+        print(f'    {name:<16}{ms:8.2f} ms')
+    print(f"    speed-up        {timings['json_round_trip'] / timings['native']:8.2f}x")
@@ -0,0 +1,47 @@
+""" Benchmark of the per-HLA time to produce model and style data, parsing the
+.pdb file separately for model and style versus parsing it once into a Structure.
+
+Run from the repository root with
+    python -m benchmarks.bench_structure [pdb files]
+"""
+import sys
+import glob
+import json
+import timeit
+
+from app import pdb_parser, styles_parser
+from app.structure import Structure
+
+FIXTURE = './app/tests/data/two_chains.pdb'
+DESA_INFO = {'chain': 'A', 'desa': {'62': 'E', '65': 'Q'}, 'desa_rAb': set(), 'desa_mAb': {62}}
+
+
+def parse_twice(pdb_path):
+    """ model and style each read and decode the file """
+    pdb_parser.create_data(pdb_path)
+    styles_parser.create_style(pdb_path, 'sphere', mol_color='chain', desa_info=DESA_INFO)
+
+
+def parse_once(pdb_path):
+    """ model and style share one Structure """
+    structure = Structure.from_pdb(pdb_path)
+    json.dumps(structure.to_model())
+    styles_parser.create_style(structure, 'sphere', mol_color='chain', desa_info=DESA_INFO)
+
+
+def bench(pdb_paths, repeat=5):
+    """ Returns the best mean per-HLA time in ms of both approaches """
+    results = {}
+    for func in (parse_twice, parse_once):
+        timer = timeit.Timer(lambda: [func(path) for path in pdb_paths])
+        results[func.__name__] = min(timer.repeat(repeat, number=1)) / len(pdb_paths) * 1000
+    return results
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or sorted(glob.glob('./data/HLAMolecule/*/*.pdb'))[:20] or [FIXTURE]
+    timings = bench(paths)
+    print(f'{len(paths)} .pdb files, per HLA:')
+    for name, ms in timings.items():
+        print(f'    {name:<12}{ms:8.2f} ms')
+    print(f"    speed-up    {timings['parse_twice'] / timings['parse_once']:8.2f}x")